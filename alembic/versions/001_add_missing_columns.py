@@ -0,0 +1,117 @@
+"""Add missing columns for indexes
+
+Revision ID: 001_add_missing_columns
+Revises: 
+Create Date: 2025-09-24 14:30:00.000000
+
+"""
+from contextlib import nullcontext
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '001_add_missing_columns'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# Columns added by this migration, per table
+NEW_COLUMNS = {
+    'users': [('company_id', sa.String(255))],
+    'alerts': [('timestamp', sa.DateTime(timezone=True))],
+    'machines': [('site', sa.String(255)), ('model', sa.String(255)), ('machine_id', sa.String(255))],
+    'telemetry': [('machine_id', sa.String(255))],
+    'predictions': [
+        ('machine_id', sa.String(255)),
+        ('timestamp', sa.DateTime(timezone=True)),
+        ('health_score', sa.Float()),
+    ],
+}
+
+# Indexes over the new columns. Names match DatabaseOptimizer so the
+# startup index pass sees them as existing instead of duplicating them.
+NEW_INDEXES = [
+    ('idx_telemetry_machine_timestamp', 'telemetry', ['machine_id', 'timestamp']),
+    ('idx_predictions_machine_timestamp', 'predictions', ['machine_id', 'timestamp']),
+    ('idx_alerts_timestamp', 'alerts', ['timestamp']),
+    ('idx_users_company_id', 'users', ['company_id']),
+]
+
+
+def upgrade():
+    """Add missing columns that are referenced in indexes."""
+    
+    inspector = sa.inspect(op.get_bind())
+    existing_tables = set(inspector.get_table_names())
+    
+    for table, columns in NEW_COLUMNS.items():
+        if table not in existing_tables:
+            print(f"Could not add columns to {table}: table does not exist")
+            continue
+        
+        # Skip columns that are already present instead of relying on failures
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        missing = [(name, type_) for name, type_ in columns if name not in existing]
+        if not missing:
+            continue
+        
+        # One batch per table so SQLite rebuilds each table at most once
+        with op.batch_alter_table(table) as batch_op:
+            for name, type_ in missing:
+                batch_op.add_column(sa.Column(name, type_, nullable=True))
+        print(f"Added {', '.join(name for name, _ in missing)} columns to {table} table")
+    
+    create_indexes()
+
+
+def create_indexes():
+    """Create indexes for the new columns, concurrently on PostgreSQL."""
+    
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    is_postgresql = bind.dialect.name == 'postgresql'
+    
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block() if is_postgresql else nullcontext():
+        for name, table, columns in NEW_INDEXES:
+            if table not in existing_tables:
+                continue
+            
+            table_columns = {column['name'] for column in inspector.get_columns(table)}
+            if not set(columns) <= table_columns:
+                print(f"Could not create {name}: missing columns on {table}")
+                continue
+            
+            if name in {index['name'] for index in inspector.get_indexes(table)}:
+                continue
+            
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+            print(f"Created index {name} on {table}")
+
+
+def downgrade():
+    """Remove the added indexes and columns."""
+    
+    inspector = sa.inspect(op.get_bind())
+    existing_tables = set(inspector.get_table_names())
+    
+    for name, table, _ in NEW_INDEXES:
+        if table in existing_tables and name in {index['name'] for index in inspector.get_indexes(table)}:
+            op.drop_index(name, table_name=table)
+    
+    for table, columns in NEW_COLUMNS.items():
+        if table not in existing_tables:
+            continue
+        
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        present = [name for name, _ in columns if name in existing]
+        if not present:
+            continue
+        
+        with op.batch_alter_table(table) as batch_op:
+            for name in present:
+                batch_op.drop_column(name)
@@ -0,0 +1,29 @@
+"""Add indexed key_prefix to api_keys
+
+Revision ID: 002_add_api_key_prefix
+Revises: 001_add_missing_columns
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '002_add_api_key_prefix'
+down_revision = '001_add_missing_columns'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Add key_prefix so API keys can be looked up by index instead of a full scan."""
+
+    op.add_column('api_keys', sa.Column('key_prefix', sa.String(16), nullable=True))
+    op.create_index('ix_api_keys_key_prefix', 'api_keys', ['key_prefix'])
+
+
+def downgrade():
+    """Remove the key_prefix column and its index."""
+
+    op.drop_index('ix_api_keys_key_prefix', table_name='api_keys')
+    op.drop_column('api_keys', 'key_prefix')
@@ -0,0 +1,52 @@
+"""Store role permissions as native JSON
+
+Revision ID: 003_role_permissions_jsonb
+Revises: 002_add_api_key_prefix
+Create Date: 2026-10-16 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '003_role_permissions_jsonb'
+down_revision = '002_add_api_key_prefix'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Convert roles.permissions from a JSON-encoded TEXT blob to JSONB."""
+
+    # SQLite stores JSON as TEXT already, so only PostgreSQL needs a rewrite
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.alter_column(
+        'roles',
+        'permissions',
+        type_=postgresql.JSONB(),
+        postgresql_using='permissions::jsonb'
+    )
+    op.create_index(
+        'ix_roles_permissions',
+        'roles',
+        ['permissions'],
+        postgresql_using='gin'
+    )
+
+
+def downgrade():
+    """Convert roles.permissions back to TEXT."""
+
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.drop_index('ix_roles_permissions', table_name='roles')
+    op.alter_column(
+        'roles',
+        'permissions',
+        type_=sa.Text(),
+        postgresql_using='permissions::text'
+    )
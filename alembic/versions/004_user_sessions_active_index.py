@@ -0,0 +1,40 @@
+"""Add partial index on active user sessions
+
+Revision ID: 004_user_sessions_active_index
+Revises: 003_role_permissions_jsonb
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from contextlib import nullcontext
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '004_user_sessions_active_index'
+down_revision = '003_role_permissions_jsonb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Index active sessions by user so logins don't scan user_sessions."""
+
+    is_postgresql = op.get_bind().dialect.name == 'postgresql'
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block() if is_postgresql else nullcontext():
+        op.create_index(
+            'ix_user_sessions_user_active',
+            'user_sessions',
+            ['user_id'],
+            postgresql_where=sa.text('is_active'),
+            sqlite_where=sa.text('is_active = 1'),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    """Remove the partial index."""
+
+    op.drop_index('ix_user_sessions_user_active', table_name='user_sessions')
@@ -0,0 +1,34 @@
+"""Add unique constraint on user role assignments
+
+Revision ID: 005_user_roles_unique
+Revises: 004_user_sessions_active_index
+Create Date: 2026-10-16 10:30:00.000000
+
+"""
+from alembic import op
+
+
+revision = '005_user_roles_unique'
+down_revision = '004_user_sessions_active_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Let the database reject duplicate (user_id, role_id) assignments."""
+
+    # Remove duplicates so the constraint can be created, keeping the oldest row
+    op.execute(
+        "DELETE FROM user_roles WHERE id NOT IN "
+        "(SELECT MIN(id) FROM user_roles GROUP BY user_id, role_id)"
+    )
+
+    with op.batch_alter_table('user_roles') as batch_op:
+        batch_op.create_unique_constraint('uq_user_roles_user_id_role_id', ['user_id', 'role_id'])
+
+
+def downgrade():
+    """Remove the unique constraint."""
+
+    with op.batch_alter_table('user_roles') as batch_op:
+        batch_op.drop_constraint('uq_user_roles_user_id_role_id', type_='unique')
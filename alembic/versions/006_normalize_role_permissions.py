@@ -0,0 +1,98 @@
+"""Normalize role permissions into permissions/role_permissions tables
+
+Revision ID: 006_normalize_role_permissions
+Revises: 005_user_roles_unique
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '006_normalize_role_permissions'
+down_revision = '005_user_roles_unique'
+branch_labels = None
+depends_on = None
+
+
+def _load_permissions(value):
+    """Decode a roles.permissions value, which may be a JSON string or already a list."""
+
+    if not value:
+        return []
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value)
+
+
+def upgrade():
+    """Move roles.permissions into a Permission table joined through role_permissions."""
+
+    permissions = op.create_table(
+        'permissions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(100), nullable=False),
+    )
+    op.create_index('ix_permissions_id', 'permissions', ['id'])
+    op.create_index('ix_permissions_name', 'permissions', ['name'], unique=True)
+
+    role_permissions = op.create_table(
+        'role_permissions',
+        sa.Column('role_id', sa.Integer(), sa.ForeignKey('roles.id'), primary_key=True),
+        sa.Column('permission_id', sa.Integer(), sa.ForeignKey('permissions.id'), primary_key=True),
+    )
+    op.create_index('ix_role_permissions_permission_id', 'role_permissions', ['permission_id'])
+
+    # Copy the existing permission lists across
+    bind = op.get_bind()
+    rows = bind.execute(sa.text('SELECT id, permissions FROM roles')).fetchall()
+    role_names = {role_id: _load_permissions(value) for role_id, value in rows}
+
+    names = sorted({name for names in role_names.values() for name in names})
+    if names:
+        op.bulk_insert(permissions, [{'name': name} for name in names])
+        permission_ids = dict(
+            bind.execute(sa.text('SELECT name, id FROM permissions')).fetchall()
+        )
+        op.bulk_insert(role_permissions, [
+            {'role_id': role_id, 'permission_id': permission_ids[name]}
+            for role_id, role_perms in role_names.items()
+            for name in dict.fromkeys(role_perms)
+        ])
+
+    if bind.dialect.name == 'postgresql':
+        op.drop_index('ix_roles_permissions', table_name='roles')
+
+    with op.batch_alter_table('roles') as batch_op:
+        batch_op.drop_column('permissions')
+
+
+def downgrade():
+    """Restore roles.permissions as a JSON-encoded TEXT column."""
+
+    with op.batch_alter_table('roles') as batch_op:
+        batch_op.add_column(sa.Column('permissions', sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        'SELECT rp.role_id, p.name FROM role_permissions rp '
+        'JOIN permissions p ON p.id = rp.permission_id'
+    )).fetchall()
+
+    role_names = {}
+    for role_id, name in rows:
+        role_names.setdefault(role_id, []).append(name)
+
+    for role_id, names in role_names.items():
+        bind.execute(
+            sa.text('UPDATE roles SET permissions = :permissions WHERE id = :id'),
+            {'permissions': json.dumps(names), 'id': role_id}
+        )
+
+    op.drop_index('ix_role_permissions_permission_id', table_name='role_permissions')
+    op.drop_table('role_permissions')
+    op.drop_index('ix_permissions_name', table_name='permissions')
+    op.drop_index('ix_permissions_id', table_name='permissions')
+    op.drop_table('permissions')
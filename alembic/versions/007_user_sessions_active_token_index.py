@@ -0,0 +1,40 @@
+"""Add partial index on active session tokens
+
+Revision ID: 007_user_sessions_active_token_index
+Revises: 006_normalize_role_permissions
+Create Date: 2026-10-16 11:30:00.000000
+
+"""
+from contextlib import nullcontext
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '007_user_sessions_active_token_index'
+down_revision = '006_normalize_role_permissions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Index active sessions by token, covering expires_at for validation."""
+
+    is_postgresql = op.get_bind().dialect.name == 'postgresql'
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block() if is_postgresql else nullcontext():
+        op.create_index(
+            'ix_user_sessions_active_token',
+            'user_sessions',
+            ['session_token', 'expires_at'],
+            postgresql_where=sa.text('is_active'),
+            sqlite_where=sa.text('is_active = 1'),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    """Remove the partial index."""
+
+    op.drop_index('ix_user_sessions_active_token', table_name='user_sessions')
@@ -5,34 +5,59 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timezone
+import sys
 
 from ..db import get_db
-from .service import AuthService
-from .models import User
+from .service import AuthService, start_request_cache
+from .models import User, API_KEY_PREFIX
 
 # Security scheme
 security = HTTPBearer()
 
-def get_auth_service(db: Session = Depends(get_db)) -> AuthService:
+async def use_request_cache():
+    """Start a fresh per-request auth lookup cache.
+    
+    Async so it runs in the request's own context; sync dependencies and
+    endpoints run in threadpool copies of that context and share the dict.
+    """
+    start_request_cache()
+
+def get_auth_service(db: Session = Depends(get_db), _cache: None = Depends(use_request_cache)) -> AuthService:
     """Get authentication service instance."""
     return AuthService(db)
 
+def current_utc() -> datetime:
+    """Current UTC time, resolved once per request by FastAPI's dependency cache."""
+    return datetime.now(timezone.utc)
+
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    auth_service: AuthService = Depends(get_auth_service)
+    auth_service: AuthService = Depends(get_auth_service),
+    now: datetime = Depends(current_utc)
 ) -> User:
     """Get current authenticated user from token."""
     token = credentials.credentials
     
-    # Try API key authentication first
-    user = auth_service.authenticate_api_key(token)
-    if user:
-        return user
+    # Reuse a recent resolution of this token
+    cached = auth_service.get_cached_token(token)
+    if cached:
+        user = auth_service.get_user_by_id(cached[1])
+        if user:
+            return user
+        auth_service.evict_cached_token(token)
+    
+    # Only tokens shaped like API keys need the API key lookup
+    if token.startswith(API_KEY_PREFIX):
+        user = auth_service.authenticate_api_key(token)
+        if user:
+            auth_service.cache_token(token, "api_key", user.id)
+            return user
     
     # Try session token authentication
-    session = auth_service.get_session(token)
+    session = auth_service.get_session(token, now)
     if session and session.user:
+        auth_service.cache_token(token, "session", session.user_id)
         return session.user
     
     raise HTTPException(
@@ -61,14 +86,15 @@ def get_current_superuser(current_user: User = Depends(get_current_active_user))
 
 def get_optional_current_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    auth_service: AuthService = Depends(get_auth_service)
+    auth_service: AuthService = Depends(get_auth_service),
+    now: datetime = Depends(current_utc)
 ) -> Optional[User]:
     """Get current user if authenticated, otherwise None."""
     if not credentials:
         return None
     
     try:
-        return get_current_user(credentials, auth_service)
+        return get_current_user(credentials, auth_service, now)
     except HTTPException:
         return None
 
@@ -76,7 +102,7 @@ def get_optional_current_user(
 def require_role(role_name: str):
     """Decorator to require a specific role."""
     def role_checker(current_user: User = Depends(get_current_active_user)):
-        user_roles = [role.name for role in current_user.roles]
+        user_roles = [user_role.role.name for user_role in current_user.roles]
         if role_name not in user_roles and not current_user.is_superuser:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -87,23 +113,15 @@ def require_role(role_name: str):
 
 def require_permission(permission: str):
     """Decorator to require a specific permission."""
+    # Interned to match Role.permission_set, so set lookups can short-circuit on identity
+    permission = sys.intern(permission)
+    
     def permission_checker(current_user: User = Depends(get_current_active_user)):
         # Superusers have all permissions
         if current_user.is_superuser:
             return current_user
         
-        # Check user roles for permission
-        user_permissions = []
-        for role in current_user.roles:
-            if role.permissions:
-                import json
-                try:
-                    role_permissions = json.loads(role.permissions)
-                    user_permissions.extend(role_permissions)
-                except json.JSONDecodeError:
-                    continue
-        
-        if permission not in user_permissions:
+        if permission not in current_user.permission_set:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Requires {permission} permission"
@@ -1,14 +1,41 @@
 """
 Authentication models for user management and role-based access control.
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from passlib.context import CryptContext
-from datetime import datetime
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+import bcrypt
+from datetime import datetime, timezone
+from functools import cached_property
+from typing import Optional
+import hashlib
+import hmac
 import secrets
+import sys
+from ..config import settings
 from ..db import Base
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# New hashes use argon2id; existing bcrypt hashes still verify and are marked deprecated
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__time_cost=2,
+    argon2__memory_cost=65536,
+    argon2__parallelism=1
+)
+
+# Verifying through the backends directly skips CryptContext's per-call scheme
+# detection; pwd_context is still used for hashing and needs_update
+_argon2_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+
+# Marks API keys so they can be told apart from session tokens without a lookup
+API_KEY_PREFIX = "mk_"
+
+# Characters of a key stored in the indexed key_prefix column; the marker plus
+# eight random characters (48 bits) keeps lookups down to about one row
+API_KEY_LOOKUP_LENGTH = len(API_KEY_PREFIX) + 8
 
 class User(Base):
     """User model for authentication and authorization."""
@@ -27,17 +54,31 @@ class User(Base):
     last_login = Column(DateTime(timezone=True))
     
     # Relationships - specify foreign_keys to avoid ambiguity
-    roles = relationship("UserRole", foreign_keys="UserRole.user_id", back_populates="user")
+    roles = relationship("UserRole", foreign_keys="UserRole.user_id", back_populates="user", lazy="selectin")
     sessions = relationship("UserSession", back_populates="user")
     
     def verify_password(self, password: str) -> bool:
         """Verify a password against the hashed password."""
-        return pwd_context.verify(password, self.hashed_password)
+        hashed_password = self.hashed_password
+        if hashed_password.startswith("$argon2"):
+            try:
+                return _argon2_hasher.verify(hashed_password, password)
+            except (VerificationError, InvalidHashError):
+                return False
+        if hashed_password.startswith("$2"):
+            # bcrypt only reads the first 72 bytes, as passlib does
+            return bcrypt.checkpw(password.encode("utf-8")[:72], hashed_password.encode("utf-8"))
+        return pwd_context.verify(password, hashed_password)
     
     @staticmethod
     def hash_password(password: str) -> str:
         """Hash a password."""
         return pwd_context.hash(password)
+    
+    @cached_property
+    def permission_set(self) -> frozenset:
+        """All permissions granted through the user's roles, computed once per instance."""
+        return frozenset().union(*(user_role.role.permission_set for user_role in self.roles))
 
 class Role(Base):
     """Role model for role-based access control."""
@@ -47,17 +88,46 @@ class Role(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), unique=True, index=True, nullable=False)
     description = Column(Text)
-    permissions = Column(Text)  # JSON string of permissions
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     users = relationship("UserRole", back_populates="role")
+    granted_permissions = relationship("Permission", secondary="role_permissions", lazy="selectin")
+    
+    @property
+    def permissions(self) -> list[str]:
+        """Names of the permissions granted by this role."""
+        return [permission.name for permission in self.granted_permissions]
+    
+    @cached_property
+    def permission_set(self) -> frozenset:
+        """Interned permission names for O(1) checks, computed once per instance."""
+        return frozenset(sys.intern(permission.name) for permission in self.granted_permissions)
+
+class Permission(Base):
+    """Named permission that roles can grant."""
+    
+    __tablename__ = "permissions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), unique=True, index=True, nullable=False)
+
+class RolePermission(Base):
+    """Many-to-many relationship between roles and permissions."""
+    
+    __tablename__ = "role_permissions"
+    
+    role_id = Column(Integer, ForeignKey("roles.id"), primary_key=True)
+    permission_id = Column(Integer, ForeignKey("permissions.id"), primary_key=True, index=True)
 
 class UserRole(Base):
     """Many-to-many relationship between users and roles."""
     
     __tablename__ = "user_roles"
+    __table_args__ = (
+        UniqueConstraint("user_id", "role_id", name="uq_user_roles_user_id_role_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -67,7 +137,7 @@ class UserRole(Base):
     
     # Relationships - specify foreign_keys to avoid ambiguity
     user = relationship("User", foreign_keys=[user_id], back_populates="roles")
-    role = relationship("Role", back_populates="users")
+    role = relationship("Role", back_populates="users", lazy="selectin")
     assigner = relationship("User", foreign_keys=[assigned_by])
 
 class UserSession(Base):
@@ -85,12 +155,35 @@ class UserSession(Base):
     user_agent = Column(Text)
     is_active = Column(Boolean, default=True)
     
+    # Partial indexes for deactivating a user's active sessions on login and
+    # for token validation, which also reads expires_at from the index.
+    # now() isn't immutable, so expiry can't be part of the predicate itself.
+    __table_args__ = (
+        Index(
+            "ix_user_sessions_user_active",
+            user_id,
+            postgresql_where=is_active == True,
+            sqlite_where=is_active == True
+        ),
+        Index(
+            "ix_user_sessions_active_token",
+            session_token,
+            expires_at,
+            postgresql_where=is_active == True,
+            sqlite_where=is_active == True
+        ),
+    )
+    
     # Relationships
     user = relationship("User", back_populates="sessions")
     
-    def is_expired(self) -> bool:
-        """Check if the session has expired."""
-        return datetime.utcnow() > self.expires_at
+    def is_expired(self, now: Optional[datetime] = None) -> bool:
+        """Check if the session has expired, optionally against a precomputed UTC time."""
+        expires_at = self.expires_at
+        if expires_at.tzinfo is None:
+            # SQLite hands back naive datetimes; they are stored as UTC
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return (now or datetime.now(timezone.utc)) > expires_at
     
     @staticmethod
     def generate_session_token() -> str:
@@ -106,6 +199,7 @@ class APIKey(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     name = Column(String(255), nullable=False)
     key_hash = Column(String(255), unique=True, index=True, nullable=False)
+    key_prefix = Column(String(16), index=True)
     permissions = Column(Text)  # JSON string of permissions
     expires_at = Column(DateTime(timezone=True))
     last_used = Column(DateTime(timezone=True))
@@ -118,7 +212,12 @@ class APIKey(Base):
     @staticmethod
     def generate_api_key() -> tuple[str, str, str]:
         """Generate a secure API key and return key, hash, and prefix."""
-        key = secrets.token_urlsafe(32)
-        key_hash = User.hash_password(key)
-        key_prefix = key[:8]
+        key = API_KEY_PREFIX + secrets.token_urlsafe(32)
+        key_hash = APIKey.hash_key(key)
+        key_prefix = key[:API_KEY_LOOKUP_LENGTH]
         return key, key_hash, key_prefix
+    
+    @staticmethod
+    def hash_key(key: str) -> str:
+        """Hash an API key with HMAC-SHA256 and the server-side pepper."""
+        return hmac.new(settings.api_key_pepper.encode(), key.encode(), hashlib.sha256).hexdigest()
@@ -1,9 +1,29 @@
 """
 Pydantic schemas for authentication and user management.
 """
-from pydantic import BaseModel, EmailStr, validator
+from pydantic import BaseModel, ConfigDict, EmailStr, validator
 from typing import Optional, List
 from datetime import datetime
+import re
+
+# Matches passwords that satisfy every strength rule in a single pass
+_STRONG_PASSWORD_RE = re.compile(r'(?=.*[A-Z])(?=.*[a-z])(?=.*\d).{8,}', re.DOTALL)
+
+def _validate_password_strength(v: str) -> str:
+    """Validate password strength, reporting the first rule that fails."""
+    if _STRONG_PASSWORD_RE.match(v):
+        return v
+    
+    # Slow path: find which rule failed (also accepts non-ASCII letters and digits)
+    if len(v) < 8:
+        raise ValueError('Password must be at least 8 characters long')
+    if not any(c.isupper() for c in v):
+        raise ValueError('Password must contain at least one uppercase letter')
+    if not any(c.islower() for c in v):
+        raise ValueError('Password must contain at least one lowercase letter')
+    if not any(c.isdigit() for c in v):
+        raise ValueError('Password must contain at least one digit')
+    return v
 
 class UserBase(BaseModel):
     """Base user schema."""
@@ -18,15 +38,7 @@ class UserCreate(UserBase):
     
     @validator('password')
     def validate_password(cls, v):
-        if len(v) < 8:
-            raise ValueError('Password must be at least 8 characters long')
-        if not any(c.isupper() for c in v):
-            raise ValueError('Password must contain at least one uppercase letter')
-        if not any(c.islower() for c in v):
-            raise ValueError('Password must contain at least one lowercase letter')
-        if not any(c.isdigit() for c in v):
-            raise ValueError('Password must contain at least one digit')
-        return v
+        return _validate_password_strength(v)
 
 class UserUpdate(BaseModel):
     """Schema for updating user information."""
@@ -44,8 +56,7 @@ class UserResponse(UserBase):
     last_login: Optional[datetime] = None
     roles: List[str] = []
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class UserLogin(BaseModel):
     """Schema for user login."""
@@ -80,8 +91,7 @@ class RoleResponse(RoleBase):
     is_active: bool
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class UserRoleAssign(BaseModel):
     """Schema for assigning roles to users."""
@@ -103,8 +113,7 @@ class APIKeyResponse(BaseModel):
     last_used: Optional[datetime] = None
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class APIKeyCreateResponse(APIKeyResponse):
     """Schema for API key creation response (includes the actual key)."""
@@ -117,15 +126,7 @@ class PasswordChange(BaseModel):
     
     @validator('new_password')
     def validate_new_password(cls, v):
-        if len(v) < 8:
-            raise ValueError('Password must be at least 8 characters long')
-        if not any(c.isupper() for c in v):
-            raise ValueError('Password must contain at least one uppercase letter')
-        if not any(c.islower() for c in v):
-            raise ValueError('Password must contain at least one lowercase letter')
-        if not any(c.isdigit() for c in v):
-            raise ValueError('Password must contain at least one digit')
-        return v
+        return _validate_password_strength(v)
 
 class PasswordReset(BaseModel):
     """Schema for password reset request."""
@@ -138,15 +139,7 @@ class PasswordResetConfirm(BaseModel):
     
     @validator('new_password')
     def validate_new_password(cls, v):
-        if len(v) < 8:
-            raise ValueError('Password must be at least 8 characters long')
-        if not any(c.isupper() for c in v):
-            raise ValueError('Password must contain at least one uppercase letter')
-        if not any(c.islower() for c in v):
-            raise ValueError('Password must contain at least one lowercase letter')
-        if not any(c.isdigit() for c in v):
-            raise ValueError('Password must contain at least one digit')
-        return v
+        return _validate_password_strength(v)
 
 class UserSessionResponse(BaseModel):
     """Schema for user session response."""
@@ -160,5 +153,4 @@ class UserSessionResponse(BaseModel):
     user_agent: Optional[str] = None
     is_active: bool
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
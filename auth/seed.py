@@ -3,7 +3,7 @@ Seed script to create default users and roles.
 """
 from sqlalchemy.orm import Session
 from .models import User, Role, UserRole
-from .service import AuthService
+from .service import get_or_create_permissions
 
 def create_default_roles(db: Session):
     """Create default roles."""
@@ -48,20 +48,40 @@ def create_default_roles(db: Session):
         }
     ]
     
-    auth_service = AuthService(db)
+    # Check which roles already exist in one query
+    existing_names = {
+        name for (name,) in db.query(Role.name).filter(
+            Role.name.in_([role_data["name"] for role_data in roles_data])
+        )
+    }
     
-    for role_data in roles_data:
-        # Check if role already exists
-        existing_role = auth_service.get_role_by_name(role_data["name"])
-        if not existing_role:
-            from .schemas import RoleCreate
-            role_create = RoleCreate(
-                name=role_data["name"],
-                description=role_data["description"],
-                permissions=role_data["permissions"]
-            )
-            auth_service.create_role(role_create)
-            print(f"Created role: {role_data['name']}")
+    new_roles_data = [
+        role_data for role_data in roles_data
+        if role_data["name"] not in existing_names
+    ]
+    
+    # Resolve every permission the new roles need in one query
+    permissions = {
+        permission.name: permission
+        for permission in get_or_create_permissions(
+            db, [name for role_data in new_roles_data for name in role_data["permissions"]]
+        )
+    }
+    
+    new_roles = [
+        Role(
+            name=role_data["name"],
+            description=role_data["description"],
+            granted_permissions=[permissions[name] for name in role_data["permissions"]]
+        )
+        for role_data in new_roles_data
+    ]
+    
+    db.add_all(new_roles)
+    db.flush()
+    
+    for role in new_roles:
+        print(f"Created role: {role.name}")
 
 def create_default_users(db: Session):
     """Create default users."""
@@ -100,45 +120,61 @@ def create_default_users(db: Session):
         }
     ]
     
-    auth_service = AuthService(db)
+    # Check which users already exist in one query
+    existing_usernames = {
+        username for (username,) in db.query(User.username).filter(
+            User.username.in_([user_data["username"] for user_data in users_data])
+        )
+    }
+    new_users_data = [
+        user_data for user_data in users_data
+        if user_data["username"] not in existing_usernames
+    ]
     
-    for user_data in users_data:
-        # Check if user already exists
-        existing_user = auth_service.get_user_by_username(user_data["username"])
-        if not existing_user:
-            from .schemas import UserCreate
-            user_create = UserCreate(
-                email=user_data["email"],
-                username=user_data["username"],
-                full_name=user_data["full_name"],
-                password=user_data["password"],
-                is_active=True
-            )
-            
-            user = auth_service.create_user(user_create)
-            
-            # Make superuser if specified
-            if user_data["is_superuser"]:
-                user.is_superuser = True
-                db.commit()
-            
-            # Assign roles
-            for role_name in user_data["roles"]:
-                role = auth_service.get_role_by_name(role_name)
-                if role:
-                    auth_service.assign_role_to_user(user.id, role.id, user.id)
-            
-            print(f"Created user: {user_data['username']}")
+    new_users = [
+        User(
+            email=user_data["email"],
+            username=user_data["username"],
+            full_name=user_data["full_name"],
+            hashed_password=User.hash_password(user_data["password"]),
+            is_active=True,
+            is_superuser=user_data["is_superuser"]
+        )
+        for user_data in new_users_data
+    ]
+    
+    db.add_all(new_users)
+    db.flush()  # Assigns user IDs for the role rows below
+    
+    # Assign roles
+    roles_by_name = {role.name: role for role in db.query(Role).all()}
+    db.add_all([
+        UserRole(user_id=user.id, role_id=roles_by_name[role_name].id, assigned_by=user.id)
+        for user, user_data in zip(new_users, new_users_data)
+        for role_name in user_data["roles"]
+        if role_name in roles_by_name
+    ])
+    db.flush()
+    
+    for user in new_users:
+        print(f"Created user: {user.username}")
 
 def seed_database(db: Session):
     """Seed the database with default data."""
     print("🌱 Seeding database with default users and roles...")
     
-    # Create roles first
-    create_default_roles(db)
-    
-    # Create users
-    create_default_users(db)
+    # Everything is written in a single transaction
+    try:
+        # Create roles first
+        create_default_roles(db)
+        
+        # Create users
+        create_default_users(db)
+        
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     
     print("✅ Database seeding completed!")
     print("\n📋 Default Login Credentials:")
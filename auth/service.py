@@ -2,20 +2,152 @@
 Authentication service for user management and security.
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, or_, update, select, bindparam
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
-from datetime import datetime, timedelta
-from typing import Optional, List
+from cachetools import TTLCache
+from datetime import datetime, timedelta, timezone
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional, List, Tuple, Dict
+from loguru import logger
+import asyncio
 import secrets
-import json
+import hashlib
+import hmac
+import threading
 
-from .models import User, Role, UserRole, UserSession, APIKey
+from ..db import SessionLocal
+from .models import User, Role, UserRole, UserSession, APIKey, Permission, pwd_context, API_KEY_LOOKUP_LENGTH
 from .schemas import (
     UserCreate, UserUpdate, UserLogin, TokenData,
     RoleCreate, UserRoleAssign, APIKeyCreate,
     PasswordChange, PasswordReset, PasswordResetConfirm
 )
 
+# Resolved bearer tokens, keyed by sha256(token) -> (kind, user_id).
+# Per-process only; invalidation across workers needs a shared store.
+_token_cache = TTLCache(maxsize=10_000, ttl=30)
+_token_cache_lock = threading.Lock()
+
+def _token_cache_key(token: str) -> str:
+    """Hash a bearer token so raw tokens are never kept in memory."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _violated_constraint(error: IntegrityError) -> Optional[str]:
+    """Name of the constraint behind an IntegrityError, when the driver reports it (psycopg2 does)."""
+    diag = getattr(error.orig, "diag", None)
+    return getattr(diag, "constraint_name", None)
+
+# Activity timestamps waiting to be written, keyed by model -> {row id: timestamp}.
+# Audit fields only, so a few seconds of staleness is acceptable.
+_pending_activity: Dict[type, Dict[int, datetime]] = {User: {}, APIKey: {}, UserSession: {}}
+_pending_activity_columns = {User: "last_login", APIKey: "last_used", UserSession: "last_activity"}
+_pending_activity_lock = threading.Lock()
+
+# A session's last_activity is only rewritten once it is at least this stale,
+# so reads of an active session do not each queue a write
+SESSION_ACTIVITY_INTERVAL = timedelta(seconds=60)
+
+def _queue_activity(model: type, row_id: int):
+    """Record an activity timestamp to be written by the next flush."""
+    with _pending_activity_lock:
+        _pending_activity[model][row_id] = datetime.now(timezone.utc)
+
+def flush_pending_activity(db: Session) -> int:
+    """Write all queued activity timestamps in a single transaction."""
+    with _pending_activity_lock:
+        batches = {model: pending.copy() for model, pending in _pending_activity.items() if pending}
+        for pending in _pending_activity.values():
+            pending.clear()
+    
+    if not batches:
+        return 0
+    
+    for model, pending in batches.items():
+        column = _pending_activity_columns[model]
+        db.execute(
+            update(model),
+            [{"id": row_id, column: timestamp} for row_id, timestamp in pending.items()]
+        )
+    db.commit()
+    
+    return sum(len(pending) for pending in batches.values())
+
+async def run_activity_flusher(interval: float = 5.0):
+    """Periodically flush queued activity timestamps until cancelled."""
+    def flush():
+        db = SessionLocal()
+        try:
+            flush_pending_activity(db)
+        finally:
+            db.close()
+    
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(flush)
+            except Exception as e:
+                logger.error(f"Failed to flush auth activity timestamps: {e}")
+    finally:
+        # Write whatever is left on shutdown
+        await asyncio.to_thread(flush)
+
+# Hot lookups are built once with bound parameters so the compiled SQL is
+# reused from the engine's compiled cache on every call
+_user_by_id_stmt = select(User).where(User.id == bindparam("user_id"))
+_user_by_email_stmt = select(User).where(User.email == bindparam("email"))
+_user_by_username_stmt = select(User).where(User.username == bindparam("username"))
+_role_by_name_stmt = select(Role).where(Role.name == bindparam("name"))
+
+# Per-request memo of user/role lookups, keyed by (kind, name). None outside a
+# request, which disables it; only hits are stored so a miss never goes stale.
+_request_cache: ContextVar[Optional[dict]] = ContextVar("auth_request_cache", default=None)
+
+def start_request_cache():
+    """Give the current request its own empty lookup cache."""
+    _request_cache.set({})
+
+def _clear_request_cache(kind: str):
+    """Drop every cached lookup of one kind after a write."""
+    cache = _request_cache.get()
+    if cache:
+        for key in [key for key in cache if key[0] == kind]:
+            del cache[key]
+
+def _request_cached(kind: str):
+    """Memoize a by-name lookup for the rest of the current request."""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, name: str):
+            cache = _request_cache.get()
+            if cache is None:
+                return method(self, name)
+            
+            key = (kind, name)
+            if key not in cache:
+                result = method(self, name)
+                if result is None:
+                    return None
+                cache[key] = result
+            return cache[key]
+        return wrapper
+    return decorator
+
+def get_or_create_permissions(db: Session, names: List[str]) -> List[Permission]:
+    """Load permissions by name, adding any that don't exist yet to the session."""
+    permissions = {
+        permission.name: permission
+        for permission in db.query(Permission).filter(Permission.name.in_(names))
+    }
+    for name in names:
+        if name not in permissions:
+            permissions[name] = Permission(name=name)
+            db.add(permissions[name])
+    
+    return [permissions[name] for name in dict.fromkeys(names)]
+
 class AuthService:
     """Service class for authentication and user management."""
     
@@ -26,17 +158,7 @@ class AuthService:
     def create_user(self, user_data: UserCreate) -> User:
         """Create a new user."""
         # Check if user already exists
-        if self.get_user_by_email(user_data.email):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered"
-            )
-        
-        if self.get_user_by_username(user_data.username):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Username already taken"
-            )
+        self._check_user_conflicts(user_data.email, user_data.username)
         
         # Create new user
         hashed_password = User.hash_password(user_data.password)
@@ -51,20 +173,22 @@ class AuthService:
         self.db.add(db_user)
         self.db.commit()
         self.db.refresh(db_user)
+        _clear_request_cache("user")
         
         return db_user
     
     def get_user_by_id(self, user_id: int) -> Optional[User]:
         """Get user by ID."""
-        return self.db.query(User).filter(User.id == user_id).first()
+        return self.db.execute(_user_by_id_stmt, {"user_id": user_id}).scalar_one_or_none()
     
     def get_user_by_email(self, email: str) -> Optional[User]:
         """Get user by email."""
-        return self.db.query(User).filter(User.email == email).first()
+        return self.db.execute(_user_by_email_stmt, {"email": email}).scalar_one_or_none()
     
+    @_request_cached("user")
     def get_user_by_username(self, username: str) -> Optional[User]:
         """Get user by username."""
-        return self.db.query(User).filter(User.username == username).first()
+        return self.db.execute(_user_by_username_stmt, {"username": username}).scalar_one_or_none()
     
     def update_user(self, user_id: int, user_data: UserUpdate) -> User:
         """Update user information."""
@@ -76,42 +200,62 @@ class AuthService:
             )
         
         # Check for conflicts
-        if user_data.email and user_data.email != user.email:
-            if self.get_user_by_email(user_data.email):
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Email already registered"
-                )
-        
-        if user_data.username and user_data.username != user.username:
-            if self.get_user_by_username(user_data.username):
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Username already taken"
-                )
+        self._check_user_conflicts(
+            user_data.email if user_data.email != user.email else None,
+            user_data.username if user_data.username != user.username else None
+        )
         
         # Update fields
-        for field, value in user_data.dict(exclude_unset=True).items():
+        for field, value in user_data.model_dump(exclude_unset=True).items():
             setattr(user, field, value)
         
         self.db.commit()
         self.db.refresh(user)
+        _clear_request_cache("user")
         
         return user
     
+    def _check_user_conflicts(self, email: Optional[str], username: Optional[str]):
+        """Raise if the email or username is already taken, using a single query."""
+        filters = []
+        if email:
+            filters.append(User.email == email)
+        if username:
+            filters.append(User.username == username)
+        if not filters:
+            return
+        
+        rows = self.db.query(User.email, User.username).filter(or_(*filters)).limit(2).all()
+        
+        if email and any(row.email == email for row in rows):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already registered"
+            )
+        
+        if username and any(row.username == username for row in rows):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username already taken"
+            )
+    
     def delete_user(self, user_id: int) -> bool:
         """Delete a user."""
-        user = self.get_user_by_id(user_id)
-        if not user:
+        # Deactivate instead of hard delete. Loaded objects are not synchronized
+        # with bulk updates here; the commit that follows expires them all.
+        result = self.db.execute(
+            update(User).where(User.id == user_id).values(is_active=False),
+            execution_options={"synchronize_session": False}
+        )
+        self.db.commit()
+        _clear_request_cache("user")
+        
+        if result.rowcount == 0:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
         
-        # Deactivate instead of hard delete
-        user.is_active = False
-        self.db.commit()
-        
         return True
     
     # Authentication
@@ -127,9 +271,13 @@ class AuthService:
         if not user.verify_password(password):
             return None
         
+        # Rehash legacy bcrypt hashes with the current scheme
+        if pwd_context.needs_update(user.hashed_password):
+            user.hashed_password = User.hash_password(password)
+            self.db.commit()
+        
         # Update last login
-        user.last_login = datetime.utcnow()
-        self.db.commit()
+        _queue_activity(User, user.id)
         
         return user
     
@@ -141,7 +289,7 @@ class AuthService:
         ).update({"is_active": False})
         
         # Create new session
-        expires_at = datetime.utcnow() + timedelta(hours=24)  # 24 hour session
+        expires_at = datetime.now(timezone.utc) + timedelta(hours=24)  # 24 hour session
         
         session = UserSession(
             user_id=user_id,
@@ -157,8 +305,8 @@ class AuthService:
         
         return session
     
-    def get_session(self, session_token: str) -> Optional[UserSession]:
-        """Get an active session by token."""
+    def get_session(self, session_token: str, now: Optional[datetime] = None) -> Optional[UserSession]:
+        """Get an active session by token, checking expiry against now (UTC) if given."""
         session = self.db.query(UserSession).filter(
             and_(
                 UserSession.session_token == session_token,
@@ -166,24 +314,59 @@ class AuthService:
             )
         ).first()
         
-        if not session or session.is_expired():
+        if not session or session.is_expired(now):
             return None
         
+        now = now or datetime.now(timezone.utc)
+        last_activity = session.last_activity
+        if last_activity is not None and last_activity.tzinfo is None:
+            # SQLite hands back naive datetimes; they are stored as UTC
+            last_activity = last_activity.replace(tzinfo=timezone.utc)
+        if last_activity is None or now - last_activity >= SESSION_ACTIVITY_INTERVAL:
+            _queue_activity(UserSession, session.id)
         return session
     
     def invalidate_user_session(self, session_token: str) -> bool:
         """Invalidate a user session."""
-        session = self.get_session(session_token)
-        if session:
-            session.is_active = False
-            self.db.commit()
-            return True
-        return False
+        self.evict_cached_token(session_token)
+        
+        result = self.db.execute(
+            update(UserSession)
+            .where(and_(UserSession.session_token == session_token, UserSession.is_active == True))
+            .values(is_active=False),
+            execution_options={"synchronize_session": False}
+        )
+        self.db.commit()
+        
+        return result.rowcount > 0
+    
+    # Token Cache
+    def get_cached_token(self, token: str) -> Optional[Tuple[str, int]]:
+        """Get the cached (kind, user_id) a bearer token resolved to."""
+        with _token_cache_lock:
+            return _token_cache.get(_token_cache_key(token))
+    
+    def cache_token(self, token: str, kind: str, user_id: int):
+        """Remember which user a bearer token resolved to."""
+        with _token_cache_lock:
+            _token_cache[_token_cache_key(token)] = (kind, user_id)
+    
+    def evict_cached_token(self, token: str):
+        """Drop a bearer token from the cache."""
+        with _token_cache_lock:
+            _token_cache.pop(_token_cache_key(token), None)
+    
+    def evict_cached_user_tokens(self, user_id: int):
+        """Drop every cached token that resolved to a user."""
+        with _token_cache_lock:
+            for key, (_, cached_user_id) in list(_token_cache.items()):
+                if cached_user_id == user_id:
+                    _token_cache.pop(key, None)
     
     # Role Management
     def create_role(self, role_data: RoleCreate) -> Role:
         """Create a new role."""
-        if self.get_role_by_name(role_data.name):
+        if self.db.query(self.db.query(Role.id).filter(Role.name == role_data.name).exists()).scalar():
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Role already exists"
@@ -192,18 +375,20 @@ class AuthService:
         db_role = Role(
             name=role_data.name,
             description=role_data.description,
-            permissions=json.dumps(role_data.permissions)
+            granted_permissions=get_or_create_permissions(self.db, role_data.permissions)
         )
         
         self.db.add(db_role)
         self.db.commit()
         self.db.refresh(db_role)
+        _clear_request_cache("role")
         
         return db_role
     
+    @_request_cached("role")
     def get_role_by_name(self, name: str) -> Optional[Role]:
         """Get role by name."""
-        return self.db.query(Role).filter(Role.name == name).first()
+        return self.db.execute(_role_by_name_stmt, {"name": name}).scalar_one_or_none()
     
     def get_roles(self) -> List[Role]:
         """Get all roles."""
@@ -211,16 +396,12 @@ class AuthService:
     
     def assign_role_to_user(self, user_id: int, role_id: int, assigned_by: int) -> UserRole:
         """Assign a role to a user."""
-        # Check if assignment already exists
-        existing = self.db.query(UserRole).filter(
-            and_(UserRole.user_id == user_id, UserRole.role_id == role_id)
-        ).first()
-        
-        if existing:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="User already has this role"
-            )
+        already_assigned = HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User already has this role"
+        )
+        if self._user_has_role(user_id, role_id):
+            raise already_assigned
         
         user_role = UserRole(
             user_id=user_id,
@@ -228,12 +409,30 @@ class AuthService:
             assigned_by=assigned_by
         )
         
+        # The unique (user_id, role_id) constraint still rejects a concurrent
+        # duplicate that slipped past the check above
         self.db.add(user_role)
-        self.db.commit()
+        try:
+            self.db.commit()
+        except IntegrityError as e:
+            self.db.rollback()
+            # Other violations, such as an unknown user or role, are not duplicates
+            if (_violated_constraint(e) == "uq_user_roles_user_id_role_id"
+                    or self._user_has_role(user_id, role_id)):
+                raise already_assigned
+            raise
         self.db.refresh(user_role)
+        _clear_request_cache("user")
         
         return user_role
     
+    def _user_has_role(self, user_id: int, role_id: int) -> bool:
+        """Whether the role is already assigned to the user."""
+        return self.db.query(UserRole.id).filter(
+            UserRole.user_id == user_id,
+            UserRole.role_id == role_id
+        ).first() is not None
+    
     def get_user_roles(self, user_id: int) -> List[Role]:
         """Get all roles for a user."""
         return self.db.query(Role).join(UserRole).filter(
@@ -268,28 +467,42 @@ class AuthService:
     
     def revoke_api_key(self, api_key_id: int) -> bool:
         """Revoke an API key."""
-        api_key = self.db.query(APIKey).filter(APIKey.id == api_key_id).first()
-        if not api_key:
+        user_id = self.db.execute(
+            update(APIKey)
+            .where(APIKey.id == api_key_id)
+            .values(is_active=False)
+            .returning(APIKey.user_id),
+            execution_options={"synchronize_session": False}
+        ).scalar()
+        self.db.commit()
+        
+        if user_id is None:
             return False
         
-        api_key.is_active = False
-        self.db.commit()
+        # The raw key is not stored, so evict everything cached for its owner
+        self.evict_cached_user_tokens(user_id)
         return True
     
     def authenticate_api_key(self, api_key: str) -> Optional[User]:
         """Authenticate a user by API key."""
-        # Find API key by checking all hashes
-        api_keys = self.db.query(APIKey).filter(APIKey.is_active == True).all()
+        # Look up the candidate keys by their indexed prefix; distinct keys can
+        # share a prefix, so the one whose hash matches is used
+        candidates = self.db.query(APIKey).filter(
+            and_(APIKey.key_prefix == api_key[:API_KEY_LOOKUP_LENGTH], APIKey.is_active == True)
+        ).all()
         
-        for db_api_key in api_keys:
-            if db_api_key.key_hash == User.hash_password(api_key):
-                # Update last used
-                db_api_key.last_used = datetime.utcnow()
-                self.db.commit()
-                
-                return self.get_user_by_id(db_api_key.user_id)
+        key_hash = APIKey.hash_key(api_key)
+        db_api_key = next(
+            (candidate for candidate in candidates if hmac.compare_digest(candidate.key_hash, key_hash)),
+            None
+        )
+        if db_api_key is None:
+            return None
         
-        return None
+        # Update last used
+        _queue_activity(APIKey, db_api_key.id)
+        
+        return self.get_user_by_id(db_api_key.user_id)
     
     # Session Management
     def get_user_sessions(self, user_id: int = None) -> List[UserSession]:
@@ -301,12 +514,19 @@ class AuthService:
     
     def terminate_session(self, session_id: int) -> bool:
         """Terminate a user session."""
-        session = self.db.query(UserSession).filter(UserSession.id == session_id).first()
-        if not session:
+        user_id = self.db.execute(
+            update(UserSession)
+            .where(UserSession.id == session_id)
+            .values(is_active=False)
+            .returning(UserSession.user_id),
+            execution_options={"synchronize_session": False}
+        ).scalar()
+        self.db.commit()
+        
+        if user_id is None:
             return False
         
-        session.is_active = False
-        self.db.commit()
+        self.evict_cached_user_tokens(user_id)
         return True
     
     # Password Management
@@ -330,9 +550,24 @@ class AuthService:
         
         return True
     
-    def get_all_users(self, skip: int = 0, limit: int = 100) -> List[User]:
-        """Get all users with pagination."""
-        return self.db.query(User).offset(skip).limit(limit).all()
+    def get_all_users(self, after_id: Optional[int] = None,
+                      limit: Optional[int] = None) -> Tuple[List[User], Optional[int]]:
+        """Get users ordered by ID, plus the cursor for the next page.
+        
+        Without a limit every user after after_id is returned and there is no next page.
+        """
+        # Keyset pagination: seek past the last ID instead of OFFSET-scanning
+        query = self.db.query(User)
+        if after_id is not None:
+            query = query.filter(User.id > after_id)
+        query = query.order_by(User.id)
+        if limit is None:
+            return query.all(), None
+        
+        users = query.limit(limit).all()
+        next_after_id = users[-1].id if len(users) == limit else None
+        
+        return users, next_after_id
     
     def get_user_count(self) -> int:
         """Get total user count."""
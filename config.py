@@ -12,6 +12,7 @@ class Settings(BaseSettings):
     
     # API Configuration
     api_key: str = os.getenv("API_KEY", "devkey")
+    api_key_pepper: str = os.getenv("API_KEY_PEPPER", "dev-api-key-pepper")
     cors_origins: str = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:3001")
     
     # Database Configuration
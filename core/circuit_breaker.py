@@ -4,13 +4,27 @@ Prevents cascade failures when external services or ML models fail.
 Critical for maintaining 99.9% uptime with 450 trucks.
 """
 
+import array
 import time
 import asyncio
+import threading
 from enum import Enum
 from typing import Callable, Any, Optional, Dict, List
 from dataclasses import dataclass
+from functools import lru_cache, wraps
 from loguru import logger
 from datetime import datetime, timedelta
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    
+    def njit(*args, **kwargs):
+        """Run the function as plain Python when Numba isn't installed."""
+        return lambda func: func
 
 class CircuitState(Enum):
     """Circuit breaker states."""
@@ -18,7 +32,7 @@ class CircuitState(Enum):
     OPEN = "open"          # Circuit is open, failing fast
     HALF_OPEN = "half_open"  # Testing if service is back
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class CircuitBreakerConfig:
     """Configuration for circuit breaker."""
     failure_threshold: int = 5        # Number of failures before opening
@@ -26,44 +40,51 @@ class CircuitBreakerConfig:
     success_threshold: int = 3        # Successes needed to close from half-open
     expected_exception: type = Exception  # Exception type to catch
 
+# Slots in CircuitBreaker._counters
+_REQUESTS, _FAILURES, _SUCCESSES, _REJECTIONS, _OPENS, _CLOSES = range(6)
+
 class CircuitBreaker:
     """Circuit breaker implementation with configurable thresholds."""
     
+    __slots__ = (
+        'name', 'config', 'state', 'failure_count', 'success_count',
+        '_last_failure_ns', '_last_success_ns', '_last_reset_ns', '_counters', '_lock'
+    )
+    
     def __init__(self, name: str, config: CircuitBreakerConfig = None):
         self.name = name
         self.config = config or CircuitBreakerConfig()
         self.state = CircuitState.CLOSED
         self.failure_count = 0
         self.success_count = 0
-        self.last_failure_time = None
-        self.last_success_time = None
-        self.total_requests = 0
-        self.total_failures = 0
-        self.total_successes = 0
         
-        # Statistics
-        self.stats = {
-            'total_requests': 0,
-            'total_failures': 0,
-            'total_successes': 0,
-            'circuit_opens': 0,
-            'circuit_closes': 0,
-            'last_reset': datetime.now()
-        }
+        # Monotonic timestamps; converted to wall-clock time only by get_stats
+        self._last_failure_ns: Optional[int] = None
+        self._last_success_ns: Optional[int] = None
+        self._last_reset_ns = time.monotonic_ns()
+        
+        # Integer counters bumped on every call; get_stats builds the dict view.
+        # Bumped without the lock, so they are statistics, not exact tallies.
+        self._counters = array.array('Q', [0] * 6)
+        
+        # Guards state transitions and the failure/success counts that drive them
+        self._lock = threading.Lock()
+    
+    @property
+    def total_requests(self) -> int:
+        return self._counters[_REQUESTS]
+    
+    @property
+    def total_failures(self) -> int:
+        return self._counters[_FAILURES]
+    
+    @property
+    def total_successes(self) -> int:
+        return self._counters[_SUCCESSES]
     
     def call(self, func: Callable, *args, **kwargs) -> Any:
         """Execute function with circuit breaker protection."""
-        self.total_requests += 1
-        self.stats['total_requests'] += 1
-        
-        # Check if circuit is open
-        if self.state == CircuitState.OPEN:
-            if self._should_attempt_reset():
-                self.state = CircuitState.HALF_OPEN
-                logger.info(f"Circuit breaker {self.name} transitioning to HALF_OPEN")
-            else:
-                self.stats['total_failures'] += 1
-                raise Exception(f"Circuit breaker {self.name} is OPEN")
+        self._before_call()
         
         try:
             # Execute the function
@@ -81,17 +102,7 @@ class CircuitBreaker:
     
     async def call_async(self, func: Callable, *args, **kwargs) -> Any:
         """Execute async function with circuit breaker protection."""
-        self.total_requests += 1
-        self.stats['total_requests'] += 1
-        
-        # Check if circuit is open
-        if self.state == CircuitState.OPEN:
-            if self._should_attempt_reset():
-                self.state = CircuitState.HALF_OPEN
-                logger.info(f"Circuit breaker {self.name} transitioning to HALF_OPEN")
-            else:
-                self.stats['total_failures'] += 1
-                raise Exception(f"Circuit breaker {self.name} is OPEN")
+        self._before_call()
         
         try:
             # Execute the async function
@@ -107,83 +118,122 @@ class CircuitBreaker:
             logger.warning(f"Unexpected exception in circuit breaker {self.name}: {e}")
             raise e
     
+    def _before_call(self):
+        """Count the request and fail fast if the circuit is open."""
+        self._counters[_REQUESTS] += 1
+        
+        # Lock-free read on the common CLOSED path
+        if self.state != CircuitState.OPEN:
+            return
+        
+        with self._lock:
+            # Re-check: another thread may have already moved to HALF_OPEN
+            if self.state == CircuitState.OPEN:
+                if self._should_attempt_reset():
+                    self.state = CircuitState.HALF_OPEN
+                    logger.info(f"Circuit breaker {self.name} transitioning to HALF_OPEN")
+                else:
+                    self._counters[_REJECTIONS] += 1
+                    raise Exception(f"Circuit breaker {self.name} is OPEN")
+    
     def _should_attempt_reset(self) -> bool:
         """Check if enough time has passed to attempt reset."""
-        if self.last_failure_time is None:
+        if self._last_failure_ns is None:
             return True
         
-        time_since_failure = time.time() - self.last_failure_time
-        return time_since_failure >= self.config.timeout
+        time_since_failure_ns = time.monotonic_ns() - self._last_failure_ns
+        return time_since_failure_ns >= self.config.timeout * 1_000_000_000
     
     def _on_success(self):
         """Handle successful execution."""
-        self.last_success_time = time.time()
-        self.total_successes += 1
-        self.stats['total_successes'] += 1
+        self._counters[_SUCCESSES] += 1
+        self._last_success_ns = time.monotonic_ns()
         
         if self.state == CircuitState.HALF_OPEN:
-            self.success_count += 1
-            if self.success_count >= self.config.success_threshold:
-                self._close_circuit()
-        elif self.state == CircuitState.CLOSED:
-            # Reset failure count on success
+            with self._lock:
+                if self.state == CircuitState.HALF_OPEN:
+                    self.success_count += 1
+                    if self.success_count >= self.config.success_threshold:
+                        self._close_circuit()
+        elif self.failure_count:
+            # Reset failure count on success (a single store, no lock needed)
             self.failure_count = 0
     
     def _on_failure(self):
         """Handle failed execution."""
-        self.last_failure_time = time.time()
-        self.failure_count += 1
-        self.total_failures += 1
-        self.stats['total_failures'] += 1
-        
-        if self.state == CircuitState.HALF_OPEN:
-            # Any failure in half-open state opens the circuit
-            self._open_circuit()
-        elif self.state == CircuitState.CLOSED:
-            if self.failure_count >= self.config.failure_threshold:
+        with self._lock:
+            self._last_failure_ns = time.monotonic_ns()
+            self.failure_count += 1
+            self._counters[_FAILURES] += 1
+            
+            if self.state == CircuitState.HALF_OPEN:
+                # Any failure in half-open state opens the circuit
                 self._open_circuit()
+            elif self.state == CircuitState.CLOSED:
+                if self.failure_count >= self.config.failure_threshold:
+                    self._open_circuit()
     
     def _open_circuit(self):
-        """Open the circuit breaker."""
+        """Open the circuit breaker. Caller must hold self._lock."""
         self.state = CircuitState.OPEN
         self.success_count = 0
-        self.stats['circuit_opens'] += 1
+        self._counters[_OPENS] += 1
         logger.warning(f"Circuit breaker {self.name} opened after {self.failure_count} failures")
     
     def _close_circuit(self):
-        """Close the circuit breaker."""
+        """Close the circuit breaker. Caller must hold self._lock."""
         self.state = CircuitState.CLOSED
         self.failure_count = 0
         self.success_count = 0
-        self.stats['circuit_closes'] += 1
-        self.stats['last_reset'] = datetime.now()
+        self._counters[_CLOSES] += 1
+        self._last_reset_ns = time.monotonic_ns()
         logger.info(f"Circuit breaker {self.name} closed after {self.config.success_threshold} successes")
     
     def get_stats(self) -> Dict[str, Any]:
         """Get circuit breaker statistics."""
-        success_rate = (self.total_successes / self.total_requests * 100) if self.total_requests > 0 else 0
+        counters = self._counters.tolist()
+        total_requests = counters[_REQUESTS]
+        success_rate = (counters[_SUCCESSES] / total_requests * 100) if total_requests > 0 else 0
+        
+        # Convert monotonic timestamps to wall-clock only when reporting
+        wall_now, mono_now = time.time(), time.monotonic_ns()
+        last_failure_time = None
+        if self._last_failure_ns is not None:
+            last_failure_time = wall_now - (mono_now - self._last_failure_ns) / 1e9
+        last_success_time = None
+        if self._last_success_ns is not None:
+            last_success_time = wall_now - (mono_now - self._last_success_ns) / 1e9
+        last_reset = datetime.fromtimestamp(wall_now - (mono_now - self._last_reset_ns) / 1e9)
         
         return {
             'name': self.name,
             'state': self.state.value,
             'failure_count': self.failure_count,
             'success_count': self.success_count,
-            'total_requests': self.total_requests,
-            'total_failures': self.total_failures,
-            'total_successes': self.total_successes,
+            'total_requests': total_requests,
+            'total_failures': counters[_FAILURES],
+            'total_successes': counters[_SUCCESSES],
             'success_rate': round(success_rate, 2),
-            'last_failure_time': self.last_failure_time,
-            'last_success_time': self.last_success_time,
-            'stats': self.stats
+            'last_failure_time': last_failure_time,
+            'last_success_time': last_success_time,
+            'stats': {
+                'total_requests': total_requests,
+                'total_failures': counters[_FAILURES] + counters[_REJECTIONS],
+                'total_successes': counters[_SUCCESSES],
+                'circuit_opens': counters[_OPENS],
+                'circuit_closes': counters[_CLOSES],
+                'last_reset': last_reset
+            }
         }
     
     def reset(self):
         """Manually reset the circuit breaker."""
-        self.state = CircuitState.CLOSED
-        self.failure_count = 0
-        self.success_count = 0
-        self.last_failure_time = None
-        self.stats['last_reset'] = datetime.now()
+        with self._lock:
+            self.state = CircuitState.CLOSED
+            self.failure_count = 0
+            self.success_count = 0
+            self._last_failure_ns = None
+            self._last_reset_ns = time.monotonic_ns()
         logger.info(f"Circuit breaker {self.name} manually reset")
 
 class CircuitBreakerManager:
@@ -194,9 +244,11 @@ class CircuitBreakerManager:
     
     def get_breaker(self, name: str, config: CircuitBreakerConfig = None) -> CircuitBreaker:
         """Get or create a circuit breaker."""
-        if name not in self.breakers:
-            self.breakers[name] = CircuitBreaker(name, config)
-        return self.breakers[name]
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            # setdefault keeps the first breaker if two threads race to create one
+            breaker = self.breakers.setdefault(name, CircuitBreaker(name, config))
+        return breaker
     
     def get_all_stats(self) -> Dict[str, Dict[str, Any]]:
         """Get statistics for all circuit breakers."""
@@ -215,7 +267,9 @@ class CircuitBreakerManager:
 # Global circuit breaker manager
 circuit_manager = CircuitBreakerManager()
 
-# Pre-configured circuit breakers for common services
+# Pre-configured circuit breakers for common services. The manager never drops
+# a breaker once created, so each helper caches the one it gets back.
+@lru_cache(maxsize=None)
 def get_ml_model_breaker() -> CircuitBreaker:
     """Get circuit breaker for ML model operations."""
     config = CircuitBreakerConfig(
@@ -226,6 +280,7 @@ def get_ml_model_breaker() -> CircuitBreaker:
     )
     return circuit_manager.get_breaker("ml_model", config)
 
+@lru_cache(maxsize=None)
 def get_database_breaker() -> CircuitBreaker:
     """Get circuit breaker for database operations."""
     config = CircuitBreakerConfig(
@@ -236,6 +291,7 @@ def get_database_breaker() -> CircuitBreaker:
     )
     return circuit_manager.get_breaker("database", config)
 
+@lru_cache(maxsize=None)
 def get_external_api_breaker() -> CircuitBreaker:
     """Get circuit breaker for external API calls."""
     config = CircuitBreakerConfig(
@@ -246,50 +302,92 @@ def get_external_api_breaker() -> CircuitBreaker:
     )
     return circuit_manager.get_breaker("external_api", config)
 
+# Rule table for fallback_prediction: (field, default, high_is_bad, bands).
+# Bands are (threshold, health deduction), most severe first; the first match applies.
+FALLBACK_RULES = (
+    ('temperature', 80, True, ((90, 20), (85, 10))),
+    ('vibration', 1.5, True, ((5, 25), (3, 15))),
+    ('oil_pressure', 3.5, False, ((2, 30), (3, 15))),
+    ('fuel_level', 75, False, ((10, 20), (25, 10))),
+)
+
+def _band_deduction(value: float, high_is_bad: bool, bands) -> float:
+    """Health deduction of the first band a value falls into, or 0."""
+    for threshold, deduction in bands:
+        if (value > threshold) if high_is_bad else (value < threshold):
+            return deduction
+    return 0
+
+# Per-field bands as plain tuples, which Numba compiles in as constants
+_TEMPERATURE_BANDS, _VIBRATION_BANDS, _OIL_PRESSURE_BANDS, _FUEL_LEVEL_BANDS = (
+    bands for _, _, _, bands in FALLBACK_RULES
+)
+
+@njit(cache=True)
+def _high_band_deduction(value, bands):
+    for threshold, deduction in bands:
+        if value > threshold:
+            return deduction
+    return 0
+
+@njit(cache=True)
+def _low_band_deduction(value, bands):
+    for threshold, deduction in bands:
+        if value < threshold:
+            return deduction
+    return 0
+
+@njit(cache=True)
+def _fallback_core(temperature, vibration, oil_pressure, fuel_level):
+    """FALLBACK_RULES applied to one row of raw floats, JIT-compiled when Numba is available."""
+    health_score = 100.0
+    health_score -= _high_band_deduction(temperature, _TEMPERATURE_BANDS)
+    health_score -= _high_band_deduction(vibration, _VIBRATION_BANDS)
+    health_score -= _low_band_deduction(oil_pressure, _OIL_PRESSURE_BANDS)
+    health_score -= _low_band_deduction(fuel_level, _FUEL_LEVEL_BANDS)
+    return max(0.0, health_score)
+
 # Fallback functions for when circuit breakers are open
 def fallback_prediction(telemetry_data: Dict[str, Any]) -> Dict[str, Any]:
     """Fallback prediction when ML model circuit breaker is open."""
     logger.warning("Using fallback prediction due to ML model circuit breaker being open")
     
     # Simple rule-based prediction
-    health_score = 100.0
-    
-    # Temperature-based health deduction
-    temp = telemetry_data.get('temperature', 80)
-    if temp > 90:
-        health_score -= 20
-    elif temp > 85:
-        health_score -= 10
-    
-    # Vibration-based health deduction
-    vibration = telemetry_data.get('vibration', 1.5)
-    if vibration > 5:
-        health_score -= 25
-    elif vibration > 3:
-        health_score -= 15
-    
-    # Oil pressure-based health deduction
-    oil_pressure = telemetry_data.get('oil_pressure', 3.5)
-    if oil_pressure < 2:
-        health_score -= 30
-    elif oil_pressure < 3:
-        health_score -= 15
-    
-    # Fuel level-based health deduction
-    fuel_level = telemetry_data.get('fuel_level', 75)
-    if fuel_level < 10:
-        health_score -= 20
-    elif fuel_level < 25:
-        health_score -= 10
+    health_score = _fallback_core(*(
+        float(telemetry_data.get(field, default)) for field, default, _, _ in FALLBACK_RULES
+    ))
     
     return {
-        "predicted_health_score": max(0, health_score),
+        "predicted_health_score": health_score,
         "prediction_type": "fallback",
         "model_version": "rule_based_v1",
         "confidence": 0.6,
         "circuit_breaker_active": True
     }
 
+def fallback_prediction_batch(telemetry: np.ndarray) -> np.ndarray:
+    """Rule-based health scores for a structured array of telemetry rows.
+    
+    Applies the same FALLBACK_RULES as fallback_prediction, one vectorized
+    pass per field; fields missing from the array use the rule default.
+    """
+    health_scores = np.full(len(telemetry), 100.0)
+    fields = telemetry.dtype.names or ()
+    
+    for field, default, high_is_bad, bands in FALLBACK_RULES:
+        if field not in fields:
+            health_scores -= _band_deduction(default, high_is_bad, bands)
+            continue
+        values = telemetry[field]
+        conditions = [
+            values > threshold if high_is_bad else values < threshold
+            for threshold, _ in bands
+        ]
+        # np.select takes the first matching band, like the scalar loop's break
+        health_scores -= np.select(conditions, [deduction for _, deduction in bands], 0.0)
+    
+    return np.maximum(health_scores, 0.0)
+
 def fallback_telemetry_processing(telemetry_data: Dict[str, Any]) -> Dict[str, Any]:
     """Fallback telemetry processing when database circuit breaker is open."""
     logger.warning("Using fallback telemetry processing due to database circuit breaker being open")
@@ -309,9 +407,11 @@ def fallback_telemetry_processing(telemetry_data: Dict[str, Any]) -> Dict[str, A
 def with_circuit_breaker(breaker_name: str, fallback_func: Callable = None, config: CircuitBreakerConfig = None):
     """Decorator to add circuit breaker protection to functions."""
     def decorator(func):
+        # The breaker name is fixed, so resolve it once at decoration time
+        breaker = circuit_manager.get_breaker(breaker_name, config)
+        
         @wraps(func)
         async def async_wrapper(*args, **kwargs):
-            breaker = circuit_manager.get_breaker(breaker_name, config)
             try:
                 return await breaker.call_async(func, *args, **kwargs)
             except Exception as e:
@@ -322,7 +422,6 @@ def with_circuit_breaker(breaker_name: str, fallback_func: Callable = None, conf
         
         @wraps(func)
         def sync_wrapper(*args, **kwargs):
-            breaker = circuit_manager.get_breaker(breaker_name, config)
             try:
                 return breaker.call(func, *args, **kwargs)
             except Exception as e:
@@ -2,17 +2,59 @@
 Global error handling middleware and custom exceptions.
 """
 
-import traceback
+import json
 from typing import Union
-from fastapi import Request, HTTPException, status
+from fastapi import Request, Response, HTTPException, status
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
-from pydantic import ValidationError
 from sqlalchemy.exc import SQLAlchemyError
 from loguru import logger
 import os
-from datetime import datetime
+import time
+from datetime import datetime, timezone
+
+from .security_logging import security_logger
+from .structured_logging import request_id_var
+
+# The environment is fixed for the life of the process
+IS_PRODUCTION = os.getenv("ENVIRONMENT") == "production"
+
+# (epoch second, ISO string) of the last error timestamp, reused within the same second.
+# Racing threads can only write the same value, so no lock is needed.
+_timestamp_cache = [0, ""]
+
+
+def _error_timestamp() -> str:
+    """Current UTC time to the second, formatted once per second."""
+    now = int(time.time())
+    if _timestamp_cache[0] != now:
+        _timestamp_cache[1] = datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        _timestamp_cache[0] = now
+    return _timestamp_cache[1]
+
+
+# Validation errors listed in a 422 response; the rest are only counted, so a
+# pathological payload can't inflate the response
+MAX_VALIDATION_ERRORS = 5
+
+# Production 500 body; only the timestamp and optional request_id vary, so they
+# are spliced into pre-encoded JSON instead of serializing a dict every time
+_INTERNAL_ERROR_BODY = (
+    b'{"error":{"code":"INTERNAL_SERVER_ERROR",'
+    b'"message":"An internal server error occurred",'
+    b'"details":{},"timestamp":"%s"%s}}'
+)
+
+
+def _internal_error_response(request_id: str = None) -> Response:
+    """Production 500 response, byte-identical to create_error_response's output."""
+    request_id_field = b',"request_id":' + json.dumps(request_id).encode() if request_id else b""
+    return Response(
+        content=_INTERNAL_ERROR_BODY % (_error_timestamp().encode(), request_id_field),
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        media_type="application/json"
+    )
 
 
 class MiningPDMException(Exception):
@@ -91,6 +133,18 @@ class RateLimitException(MiningPDMException):
         )
 
 
+# Map error codes to HTTP status codes
+STATUS_CODE_MAPPING = {
+    "AUTHENTICATION_ERROR": status.HTTP_401_UNAUTHORIZED,
+    "AUTHORIZATION_ERROR": status.HTTP_403_FORBIDDEN,
+    "DATA_VALIDATION_ERROR": status.HTTP_422_UNPROCESSABLE_ENTITY,
+    "RATE_LIMIT_ERROR": status.HTTP_429_TOO_MANY_REQUESTS,
+    "ML_MODEL_ERROR": status.HTTP_503_SERVICE_UNAVAILABLE,
+    "DATABASE_ERROR": status.HTTP_503_SERVICE_UNAVAILABLE,
+    "MINING_PDM_ERROR": status.HTTP_500_INTERNAL_SERVER_ERROR
+}
+
+
 def create_error_response(
     status_code: int,
     message: str,
@@ -105,7 +159,7 @@ def create_error_response(
             "code": error_code or "UNKNOWN_ERROR",
             "message": message,
             "details": details or {},
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": _error_timestamp()
         }
     }
     
@@ -113,7 +167,7 @@ def create_error_response(
         error_response["error"]["request_id"] = request_id
     
     # Don't expose internal details in production
-    if os.getenv("ENVIRONMENT") == "production":
+    if IS_PRODUCTION:
         if "traceback" in error_response["error"]["details"]:
             del error_response["error"]["details"]["traceback"]
         if "internal_error" in error_response["error"]["details"]:
@@ -128,30 +182,45 @@ def create_error_response(
 async def global_exception_handler(request: Request, exc: Exception) -> JSONResponse:
     """Global exception handler for unhandled exceptions."""
     
+    # This handler runs outside the user middleware stack, after request_id_var has
+    # been reset, so the id is read back from the request state instead
     request_id = getattr(request.state, "request_id", None)
     
-    # Log the full exception
-    logger.error(
+    # Log the full exception; loguru formats the traceback only if a sink emits it
+    logger.opt(exception=exc).error(
         f"Unhandled exception: {type(exc).__name__}: {str(exc)}",
         extra={
             "request_id": request_id,
             "path": request.url.path,
             "method": request.method,
-            "client_ip": request.client.host,
-            "traceback": traceback.format_exc()
+            "client_ip": request.client.host
         }
     )
     
-    # Don't expose internal details in production
-    is_production = os.getenv("ENVIRONMENT") == "production"
-    
-    details = {}
-    if not is_production:
-        # Only show details in development
-        details = {
-            "traceback": traceback.format_exc(),
-            "internal_error": str(exc)
+    # Log security event for unexpected errors
+    security_logger.log_security_event(
+        "unexpected_error",
+        severity="ERROR",
+        ip_address=request.client.host if request.client else None,
+        details={
+            "path": request.url.path,
+            "method": request.method,
+            "error": str(exc),
+            "error_type": type(exc).__name__
         }
+    )
+    
+    # Don't expose internal details in production
+    if IS_PRODUCTION:
+        return _internal_error_response(request_id)
+    
+    # Only show details in development; traceback is imported here since
+    # production never formats one
+    import traceback
+    details = {
+        "traceback": traceback.format_exc(),
+        "internal_error": str(exc)
+    }
     
     return create_error_response(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -165,20 +234,9 @@ async def global_exception_handler(request: Request, exc: Exception) -> JSONResp
 async def mining_pdm_exception_handler(request: Request, exc: MiningPDMException) -> JSONResponse:
     """Handler for custom Mining PDM exceptions."""
     
-    request_id = getattr(request.state, "request_id", None)
-    
-    # Map error codes to HTTP status codes
-    status_code_mapping = {
-        "AUTHENTICATION_ERROR": status.HTTP_401_UNAUTHORIZED,
-        "AUTHORIZATION_ERROR": status.HTTP_403_FORBIDDEN,
-        "DATA_VALIDATION_ERROR": status.HTTP_422_UNPROCESSABLE_ENTITY,
-        "RATE_LIMIT_ERROR": status.HTTP_429_TOO_MANY_REQUESTS,
-        "ML_MODEL_ERROR": status.HTTP_503_SERVICE_UNAVAILABLE,
-        "DATABASE_ERROR": status.HTTP_503_SERVICE_UNAVAILABLE,
-        "MINING_PDM_ERROR": status.HTTP_500_INTERNAL_SERVER_ERROR
-    }
+    request_id = request_id_var.get()
     
-    status_code = status_code_mapping.get(exc.error_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+    status_code = STATUS_CODE_MAPPING.get(exc.error_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     logger.warning(
         f"Mining PDM exception: {exc.error_code}: {exc.message}",
@@ -203,7 +261,7 @@ async def mining_pdm_exception_handler(request: Request, exc: MiningPDMException
 async def http_exception_handler(request: Request, exc: HTTPException) -> JSONResponse:
     """Handler for HTTP exceptions."""
     
-    request_id = getattr(request.state, "request_id", None)
+    request_id = request_id_var.get()
     
     logger.warning(
         f"HTTP exception: {exc.status_code}: {exc.detail}",
@@ -226,19 +284,22 @@ async def http_exception_handler(request: Request, exc: HTTPException) -> JSONRe
 async def validation_exception_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
     """Handler for request validation errors."""
     
-    request_id = getattr(request.state, "request_id", None)
+    request_id = request_id_var.get()
     
-    # Format validation errors
-    formatted_errors = []
-    for error in exc.errors():
-        formatted_errors.append({
-            "field": ".".join(str(loc) for loc in error["loc"]),
+    # Format validation errors, reporting only the first few in detail
+    errors = exc.errors()
+    error_count = len(errors)
+    formatted_errors = [
+        {
+            "field": ".".join(map(str, error["loc"])),
             "message": error["msg"],
             "type": error["type"]
-        })
+        }
+        for error in errors[:MAX_VALIDATION_ERRORS]
+    ]
     
     logger.warning(
-        f"Validation error: {len(formatted_errors)} validation errors",
+        f"Validation error: {error_count} validation errors",
         extra={
             "request_id": request_id,
             "validation_errors": formatted_errors,
@@ -251,7 +312,11 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
         message="Request validation failed",
         error_code="VALIDATION_ERROR",
-        details={"validation_errors": formatted_errors},
+        details={
+            "validation_errors": formatted_errors,
+            "error_count": error_count,
+            "truncated": error_count > MAX_VALIDATION_ERRORS
+        },
         request_id=request_id
     )
 
@@ -259,24 +324,21 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 async def sqlalchemy_exception_handler(request: Request, exc: SQLAlchemyError) -> JSONResponse:
     """Handler for SQLAlchemy database errors."""
     
-    request_id = getattr(request.state, "request_id", None)
+    request_id = request_id_var.get()
     
-    logger.error(
+    logger.opt(exception=exc).error(
         f"Database error: {type(exc).__name__}: {str(exc)}",
         extra={
             "request_id": request_id,
             "error_type": type(exc).__name__,
             "path": request.url.path,
-            "method": request.method,
-            "traceback": traceback.format_exc()
+            "method": request.method
         }
     )
     
     # Don't expose internal database details in production
-    is_production = os.getenv("ENVIRONMENT") == "production"
-    
     details = {}
-    if not is_production:
+    if not IS_PRODUCTION:
         # Only show details in development
         details = {
             "error_type": type(exc).__name__,
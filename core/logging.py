@@ -1,19 +1,48 @@
 """
 Simple logging configuration for the application.
 """
+import os
 import sys
 from loguru import logger
 
+# Minimum level emitted by the handlers below
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+def level_enabled(level: str) -> bool:
+    """Whether records at this level pass the configured LOG_LEVEL."""
+    return logger.level(level).no >= logger.level(LOG_LEVEL).no
+
+def _is_raw(record) -> bool:
+    """Records bound with raw=True carry an already serialized JSON line."""
+    return record["extra"].get("raw", False)
+
+# Logger for hot paths that serialize their own JSON; its records skip the formatter
+raw_logger = logger.bind(raw=True)
+
 def setup_logging():
     """Setup basic logging configuration."""
     # Remove default handler
     logger.remove()
     
+    # Handlers use enqueue=True so records are written by a background thread
+    # and request handlers never block on stdout or file I/O
     # Add simple console handler
     logger.add(
         sys.stdout,
         format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-        level="INFO"
+        level=LOG_LEVEL,
+        filter=lambda record: not _is_raw(record),
+        enqueue=True
+    )
+    
+    # Pre-serialized JSON lines are written verbatim
+    logger.add(
+        sys.stdout,
+        format="{message}",
+        level=LOG_LEVEL,
+        filter=_is_raw,
+        colorize=False,
+        enqueue=True
     )
     
     # Add file handler
@@ -22,7 +51,8 @@ def setup_logging():
         rotation="1 day",
         retention="30 days",
         format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
-        level="INFO"
+        level=LOG_LEVEL,
+        enqueue=True
     )
     
     logger.info("Logging system initialized")
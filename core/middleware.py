@@ -1,149 +1,174 @@
 """
-Custom middleware for error handling and request processing.
+Custom middleware for request processing.
+
+Written as plain ASGI callables rather than BaseHTTPMiddleware subclasses, so
+no extra task group or memory stream is set up around every request. Errors
+are handled by the exception handlers registered in error_handling.py.
 """
+import os
+import re
 import time
-import traceback
-from typing import Callable
-from fastapi import Request, Response, HTTPException
+from typing import Dict, List
+import orjson
+from fastapi import Request, Response
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .logging import StructuredLogger, level_enabled, raw_logger
+from .structured_logging import bind_request_context, request_context_var, request_id_var
+
+# Resolved once at import; the log level and this switch are fixed at startup
+_INFO_ENABLED = level_enabled("INFO")
+_PERF_LOG_ENABLED = os.getenv("PERF_LOG_ENABLED", "true").lower() == "true"
+
+# Only requests with these methods carry a body worth describing in the log
+_BODY_METHODS = frozenset({"POST", "PUT", "PATCH"})
+
+# Probe endpoints polled by load balancers and scrapers; never rate limited
+_HEALTHCHECK_PATHS = frozenset(("/health", "/healthz", "/metrics"))
 
-from .exceptions import MiningPDMException
-from .logging import StructuredLogger, logger
+# Common attack patterns, each compiled into one case-insensitive alternation
+# so a request is scanned in a single pass
+_SUSPICIOUS_PATH_RE = re.compile("|".join(map(re.escape, [
+    "..",  # Path traversal
+    "<script",  # XSS
+    "union select",  # SQL injection
+    "drop table",  # SQL injection
+    "exec(",  # Command injection
+    "eval(",  # Code injection
+])), re.IGNORECASE)
 
-class ErrorHandlingMiddleware(BaseHTTPMiddleware):
-    """Middleware for handling exceptions and errors."""
+_SUSPICIOUS_USER_AGENT_RE = re.compile("|".join(map(re.escape, [
+    "sqlmap",
+    "nikto",
+    "nmap",
+    "masscan",
+    "zap",
+    "burp"
+])), re.IGNORECASE)
+
+# Security headers added to every response, pre-encoded for the ASGI header list
+_SECURITY_HEADERS = (
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"x-xss-protection", b"1; mode=block"),
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+    (b"referrer-policy", b"strict-origin-when-cross-origin"),
+    (b"content-security-policy", b"default-src 'self'"),
+)
+
+# Constant rejection body, rendered once and reused for every blocked request
+_FORBIDDEN_RESPONSE = JSONResponse(
+    status_code=403,
+    content={
+        "error": "Forbidden",
+        "message": "Request blocked by security policy"
+    }
+)
+
+# Preflight answer for origins that are not allowed; the missing CORS headers
+# make the browser reject the cross-origin request
+_EMPTY_PREFLIGHT_RESPONSE = Response(status_code=204)
+
+class ObservabilityMiddleware:
+    """Middleware for request ids, timing and request logging in a single layer."""
     
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
+        self.app = app
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        start_ns = time.perf_counter_ns()
+        request = Request(scope)
+        
+        # Reuse the caller's request id when given; handlers read it from request.state,
+        # loggers from request_id_var and structured events from the request context
+        request_id = request.headers.get("x-request-id") or os.urandom(8).hex()
+        request.state.request_id = request_id
+        request_id_token = request_id_var.set(request_id)
+        request_context_token = bind_request_context(request_id=request_id)
+        request_id_header = (b"x-request-id", request_id.encode("latin-1"))
+        
+        # Capture the response start so it can be logged once the body is sent
+        response_start = {}
+        
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                # Copy rather than append: the header list may belong to a shared response
+                message["headers"] = [*message.get("headers", ()), request_id_header]
+                response_start.update(message)
+            await send(message)
+        
         try:
-            response = await call_next(request)
-            return response
-        except MiningPDMException as e:
-            # Handle custom application exceptions
-            logger.error(f"Application error: {e.message}", extra={
-                "error_type": type(e).__name__,
-                "details": e.details,
-                "path": request.url.path,
-                "method": request.method
-            })
+            # Process request
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            process_time_ns = time.perf_counter_ns() - start_ns
+            status_code = response_start.get("status", 500)
             
-            return JSONResponse(
-                status_code=400,
-                content={
-                    "error": "Application Error",
-                    "message": e.message,
-                    "details": e.details,
-                    "type": type(e).__name__
-                }
-            )
-        except HTTPException as e:
-            # Handle FastAPI HTTP exceptions
-            logger.warning(f"HTTP error: {e.detail}", extra={
-                "status_code": e.status_code,
-                "path": request.url.path,
-                "method": request.method
-            })
-            
-            return JSONResponse(
-                status_code=e.status_code,
-                content={
-                    "error": "HTTP Error",
-                    "message": e.detail,
-                    "status_code": e.status_code
-                }
-            )
-        except Exception as e:
-            # Handle unexpected exceptions
-            logger.error(f"Unexpected error: {str(e)}", extra={
-                "error_type": type(e).__name__,
-                "traceback": traceback.format_exc(),
-                "path": request.url.path,
-                "method": request.method
-            })
+            # Skip building the log record entirely when INFO is filtered out
+            if _INFO_ENABLED:
+                self._log_request(request, request_id, status_code, process_time_ns, response_start)
             
-            # Log security event for unexpected errors
-            StructuredLogger.log_security_event(
-                "unexpected_error",
-                ip_address=request.client.host if request.client else None,
-                details={
-                    "path": request.url.path,
-                    "method": request.method,
-                    "error": str(e),
-                    "error_type": type(e).__name__
-                }
-            )
+            if _PERF_LOG_ENABLED:
+                # Log performance metric
+                StructuredLogger.log_performance_metric(
+                    "request_processing_time",
+                    process_time_ns / 1_000_000_000,
+                    "seconds",
+                    {
+                        "method": request.method,
+                        "path": request.url.path,
+                        "status_code": str(status_code)
+                    }
+                )
             
-            return JSONResponse(
-                status_code=500,
-                content={
-                    "error": "Internal Server Error",
-                    "message": "An unexpected error occurred",
-                    "type": "InternalError"
-                }
-            )
-
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
-    """Middleware for logging requests and responses."""
+            request_id_var.reset(request_id_token)
+            request_context_var.reset(request_context_token)
     
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        # Log request
-        start_time = time.time()
-        
-        # Extract request info
+    def _log_request(self, request: Request, request_id: str, status_code: int,
+                     process_time_ns: int, response_start: Message):
+        """Log request and response as one pre-serialized JSON record."""
+        response_headers = Headers(raw=response_start.get("headers", []))
         request_info = {
             "method": request.method,
             "path": request.url.path,
-            "query_params": dict(request.query_params),
+            "query": request.url.query,
             "client_ip": request.client.host if request.client else None,
-            "user_agent": request.headers.get("user-agent"),
-            "content_type": request.headers.get("content-type"),
-            "content_length": request.headers.get("content-length")
+            "user_agent": request.headers.get("user-agent")
         }
-        
-        logger.info("Request started", extra={"request": request_info})
-        
-        # Process request
-        response = await call_next(request)
-        
-        # Log response
-        process_time = time.time() - start_time
+        if request.method in _BODY_METHODS:
+            request_info["content_type"] = request.headers.get("content-type")
+            request_info["content_length"] = request.headers.get("content-length")
         response_info = {
-            "status_code": response.status_code,
-            "process_time_ms": round(process_time * 1000, 2),
-            "content_type": response.headers.get("content-type"),
-            "content_length": response.headers.get("content-length")
+            "status_code": status_code,
+            "process_time_ms": process_time_ns // 10_000 / 100,
+            "content_type": response_headers.get("content-type"),
+            "content_length": response_headers.get("content-length")
         }
         
-        logger.info("Request completed", extra={"response": response_info})
-        
-        # Log performance metric
-        StructuredLogger.log_performance_metric(
-            "request_processing_time",
-            process_time,
-            "seconds",
-            {
-                "method": request.method,
-                "path": request.url.path,
-                "status_code": str(response.status_code)
-            }
-        )
-        
-        return response
+        raw_logger.info(orjson.dumps({
+            "event": "request_completed",
+            "request_id": request_id,
+            "request": request_info,
+            "response": response_info
+        }).decode())
 
-class SecurityMiddleware(BaseHTTPMiddleware):
+class SecurityMiddleware:
     """Middleware for security headers and protection."""
     
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
+        self.app = app
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        request = Request(scope)
+        
         # Check for suspicious patterns
         if self._is_suspicious_request(request):
             StructuredLogger.log_security_event(
@@ -157,158 +182,144 @@ class SecurityMiddleware(BaseHTTPMiddleware):
                 }
             )
             
-            return JSONResponse(
-                status_code=403,
-                content={
-                    "error": "Forbidden",
-                    "message": "Request blocked by security policy"
-                }
-            )
+            return await _FORBIDDEN_RESPONSE(scope, receive, send)
         
-        # Process request
-        response = await call_next(request)
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                # Add security headers in one concatenation; copying keeps shared responses intact
+                message["headers"] = [*message.get("headers", ()), *_SECURITY_HEADERS]
+            await send(message)
         
-        # Add security headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        response.headers["Content-Security-Policy"] = "default-src 'self'"
-        
-        return response
+        # Process request
+        await self.app(scope, receive, send_wrapper)
     
     def _is_suspicious_request(self, request: Request) -> bool:
         """Check if request is suspicious."""
-        path = request.url.path.lower()
-        user_agent = request.headers.get("user-agent", "").lower()
-        
-        # Check for common attack patterns
-        suspicious_patterns = [
-            "..",  # Path traversal
-            "<script",  # XSS
-            "union select",  # SQL injection
-            "drop table",  # SQL injection
-            "exec(",  # Command injection
-            "eval(",  # Code injection
-        ]
-        
-        # Check path
-        for pattern in suspicious_patterns:
-            if pattern in path:
-                return True
-        
-        # Check user agent
-        suspicious_user_agents = [
-            "sqlmap",
-            "nikto",
-            "nmap",
-            "masscan",
-            "zap",
-            "burp"
-        ]
-        
-        for ua in suspicious_user_agents:
-            if ua in user_agent:
-                return True
-        
-        return False
+        return bool(
+            _SUSPICIOUS_PATH_RE.search(request.url.path)
+            or _SUSPICIOUS_USER_AGENT_RE.search(request.headers.get("user-agent", ""))
+        )
 
-class RateLimitingMiddleware(BaseHTTPMiddleware):
-    """Simple rate limiting middleware."""
+class RateLimitingMiddleware:
+    """Simple token-bucket rate limiting middleware."""
+    
+    # Idle clients are swept out once every this many requests
+    SWEEP_INTERVAL = 1000
     
     def __init__(self, app: ASGIApp, requests_per_minute: int = 60):
-        super().__init__(app)
+        self.app = app
         self.requests_per_minute = requests_per_minute
-        self.requests = {}  # In production, use Redis or similar
+        self.refill_per_second = requests_per_minute / 60.0
+        # client ip -> [tokens, last refill time]; In production, use Redis or similar
+        self.buckets: Dict[str, List[float]] = {}
+        self._until_sweep = self.SWEEP_INTERVAL
+        
+        # The rejection body never changes, so it is built once
+        self._rate_limit_response = JSONResponse(
+            status_code=429,
+            content={
+                "error": "Too Many Requests",
+                "message": f"Rate limit exceeded. Maximum {requests_per_minute} requests per minute."
+            }
+        )
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        client_ip = request.client.host if request.client else "unknown"
-        current_time = time.time()
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in _HEALTHCHECK_PATHS:
+            return await self.app(scope, receive, send)
         
-        # Clean old entries
-        self._clean_old_entries(current_time)
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+        current_time = time.monotonic()
+        
+        # Refill lazily from the time elapsed since this client's last request
+        bucket = self.buckets.get(client_ip)
+        if bucket is None:
+            bucket = self.buckets[client_ip] = [float(self.requests_per_minute), current_time]
+        else:
+            bucket[0] = min(
+                self.requests_per_minute,
+                bucket[0] + (current_time - bucket[1]) * self.refill_per_second
+            )
+            bucket[1] = current_time
         
         # Check rate limit
-        if self._is_rate_limited(client_ip, current_time):
+        if bucket[0] < 1.0:
             StructuredLogger.log_security_event(
                 "rate_limit_exceeded",
                 ip_address=client_ip,
                 details={
-                    "path": request.url.path,
-                    "method": request.method,
+                    "path": scope["path"],
+                    "method": scope["method"],
                     "limit": self.requests_per_minute
                 }
             )
             
-            return JSONResponse(
-                status_code=429,
-                content={
-                    "error": "Too Many Requests",
-                    "message": f"Rate limit exceeded. Maximum {self.requests_per_minute} requests per minute."
-                }
-            )
+            return await self._rate_limit_response(scope, receive, send)
         
         # Record request
-        if client_ip not in self.requests:
-            self.requests[client_ip] = []
-        self.requests[client_ip].append(current_time)
+        bucket[0] -= 1.0
+        
+        self._until_sweep -= 1
+        if self._until_sweep <= 0:
+            self._until_sweep = self.SWEEP_INTERVAL
+            self._sweep_idle_clients(current_time)
         
         # Process request
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
     
-    def _clean_old_entries(self, current_time: float):
-        """Clean entries older than 1 minute."""
-        cutoff_time = current_time - 60
-        for client_ip in list(self.requests.keys()):
-            self.requests[client_ip] = [
-                req_time for req_time in self.requests[client_ip]
-                if req_time > cutoff_time
-            ]
-            if not self.requests[client_ip]:
-                del self.requests[client_ip]
-    
-    def _is_rate_limited(self, client_ip: str, current_time: float) -> bool:
-        """Check if client is rate limited."""
-        if client_ip not in self.requests:
-            return False
-        
-        # Count requests in the last minute
+    def _sweep_idle_clients(self, current_time: float):
+        """Forget clients idle long enough for their bucket to have refilled."""
         cutoff_time = current_time - 60
-        recent_requests = [
-            req_time for req_time in self.requests[client_ip]
-            if req_time > cutoff_time
-        ]
-        
-        return len(recent_requests) >= self.requests_per_minute
+        for client_ip in [ip for ip, (_, last_time) in self.buckets.items() if last_time <= cutoff_time]:
+            del self.buckets[client_ip]
 
-class CORSMiddleware(BaseHTTPMiddleware):
+class CORSMiddleware:
     """Custom CORS middleware with security considerations."""
     
     def __init__(self, app: ASGIApp, allowed_origins: list = None):
-        super().__init__(app)
-        self.allowed_origins = allowed_origins or ["http://localhost:3000"]
+        self.app = app
+        self.allowed_origins = frozenset(allowed_origins or ["http://localhost:3000"])
+        
+        # Everything sent back varies only by origin, so it is all built up front:
+        # a preflight response and the pre-encoded headers for other requests
+        self._preflight_responses: Dict[str, Response] = {
+            origin: Response(status_code=204, headers={
+                "Access-Control-Allow-Origin": origin,
+                "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+                "Access-Control-Allow-Headers": "Content-Type, Authorization",
+                "Access-Control-Max-Age": "86400"
+            })
+            for origin in self.allowed_origins
+        }
+        self._cors_headers: Dict[str, tuple] = {
+            origin: (
+                (b"access-control-allow-origin", origin.encode("latin-1")),
+                (b"access-control-allow-credentials", b"true"),
+            )
+            for origin in self.allowed_origins
+        }
     
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        origin = request.headers.get("origin")
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        origin = Headers(scope=scope).get("origin")
         
         # Handle preflight requests
-        if request.method == "OPTIONS":
-            response = Response()
-            if origin in self.allowed_origins:
-                response.headers["Access-Control-Allow-Origin"] = origin
-                response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-                response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
-                response.headers["Access-Control-Max-Age"] = "86400"
-            return response
+        if scope["method"] == "OPTIONS":
+            # Disallowed origins get the shared empty response, without CORS headers
+            response = self._preflight_responses.get(origin, _EMPTY_PREFLIGHT_RESPONSE)
+            return await response(scope, receive, send)
         
-        # Process request
-        response = await call_next(request)
+        cors_headers = self._cors_headers.get(origin)
+        if cors_headers is None:
+            return await self.app(scope, receive, send)
         
-        # Add CORS headers
-        if origin in self.allowed_origins:
-            response.headers["Access-Control-Allow-Origin"] = origin
-            response.headers["Access-Control-Allow-Credentials"] = "true"
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                # Add CORS headers
+                message["headers"] = [*message.get("headers", ()), *cors_headers]
+            await send(message)
         
-        return response
+        # Process request
+        await self.app(scope, receive, send_wrapper)
@@ -5,20 +5,59 @@ Essential for maintaining high performance with 450 trucks sending data.
 
 import cProfile
 import pstats
-import io
+import itertools
 import time
 import threading
+import numpy as np
 import psutil
 import os
-from typing import Dict, Any, List, Optional, Callable
+from typing import Dict, Any, List, Optional, Callable, Tuple
 from functools import wraps
 from datetime import datetime, timedelta
 from collections import defaultdict, deque
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from loguru import logger
 import asyncio
 
-@dataclass
+# Read once at startup; when off, profile_function returns functions unwrapped
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() == "true"
+
+# Opt-in ftrace markers: sampled calls are bracketed with begin/end slices in the
+# kernel trace buffer, so they line up with `perf record -e ftrace:print -g -p <pid>`
+# or a trace viewer. Needs a writable tracefs (normally root); silently off otherwise.
+_TRACE_MARKER_PATHS = ("/sys/kernel/tracing/trace_marker", "/sys/kernel/debug/tracing/trace_marker")
+
+def _open_trace_marker() -> Optional[int]:
+    """File descriptor of the ftrace marker file, or None when disabled or unavailable."""
+    if os.getenv("PROFILE_TRACE_MARKERS", "false").lower() != "true":
+        return None
+    for path in _TRACE_MARKER_PATHS:
+        try:
+            return os.open(path, os.O_WRONLY)
+        except OSError:
+            continue
+    logger.warning("PROFILE_TRACE_MARKERS is set but no writable trace_marker file was found")
+    return None
+
+_TRACE_MARKER_FD = _open_trace_marker()
+
+def _write_trace_marker(marker: str):
+    """Write one marker line to the kernel trace buffer.
+    
+    Markers must never change the outcome of the profiled call, so a failed write
+    turns them off for the rest of the process instead of raising.
+    """
+    global _TRACE_MARKER_FD
+    fd = _TRACE_MARKER_FD
+    if fd is None:
+        return
+    try:
+        os.write(fd, f"{marker}\n".encode())
+    except OSError as e:
+        _TRACE_MARKER_FD = None
+        logger.warning(f"Disabling trace markers after a failed write: {e}")
+
+@dataclass(slots=True)
 class PerformanceProfile:
     """Represents a performance profile result."""
     function_name: str
@@ -29,7 +68,7 @@ class PerformanceProfile:
     percentage: float
     timestamp: datetime
 
-@dataclass
+@dataclass(slots=True)
 class SystemMetrics:
     """System performance metrics."""
     cpu_percent: float
@@ -39,66 +78,177 @@ class SystemMetrics:
     disk_usage_percent: float
     timestamp: datetime
 
+class SystemMetricsHistory:
+    """Fixed-size ring buffer of system metrics, stored column-wise so each metric's history is contiguous."""
+    
+    FIELDS = ('cpu_percent', 'memory_percent', 'memory_used_mb', 'memory_available_mb', 'disk_usage_percent')
+    
+    def __init__(self, maxlen: int = 1000):
+        self.maxlen = maxlen
+        self._values = np.zeros((len(self.FIELDS), maxlen))
+        self._timestamps: List[Optional[datetime]] = [None] * maxlen
+        self._count = 0
+    
+    def __len__(self) -> int:
+        return min(self._count, self.maxlen)
+    
+    def append(self, metrics: SystemMetrics):
+        """Overwrite the oldest slot with a new sample."""
+        slot = self._count % self.maxlen
+        self._values[:, slot] = [getattr(metrics, name) for name in self.FIELDS]
+        self._timestamps[slot] = metrics.timestamp
+        self._count += 1
+    
+    def recent(self, n: int) -> Tuple[np.ndarray, datetime]:
+        """Columns of the last n samples, oldest first, and the newest sample's timestamp."""
+        n = min(n, len(self))
+        slots = np.arange(self._count - n, self._count) % self.maxlen
+        return self._values[:, slots], self._timestamps[(self._count - 1) % self.maxlen]
+
+@dataclass(slots=True)
+class FunctionTimings:
+    """Running execution-time aggregates for one function, in nanoseconds."""
+    count: int = 0
+    total_ns: int = 0
+    min_ns: int = 0
+    max_ns: int = 0
+    recent_ns: deque = field(default_factory=lambda: deque(maxlen=10))
+    
+    def add(self, elapsed_ns: int):
+        """Fold one call's execution time into the aggregates."""
+        if not self.count or elapsed_ns < self.min_ns:
+            self.min_ns = elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        self.count += 1
+        self.total_ns += elapsed_ns
+        self.recent_ns.append(elapsed_ns)
+    
+    def summary(self) -> Dict[str, Any]:
+        """Call count and timings in seconds."""
+        return {
+            'call_count': self.count,
+            'avg_time': self.total_ns / self.count / 1e9,
+            'min_time': self.min_ns / 1e9,
+            'max_time': self.max_ns / 1e9,
+            'total_time': self.total_ns / 1e9
+        }
+
 class PerformanceProfiler:
     """Comprehensive performance profiling system."""
     
-    def __init__(self, max_profiles: int = 100):
+    # Timing records are guarded by striped locks so threads recording different
+    # functions rarely contend; _lock only guards profiles and system metrics
+    TIMING_LOCK_STRIPES = 16
+    
+    # Disk usage is sampled once every this many system metric collections
+    DISK_USAGE_REFRESH_INTERVAL = 10
+    
+    def __init__(self, max_profiles: int = 100, sample_rate: int = 1000):
         self.profiles: deque = deque(maxlen=max_profiles)
-        self.function_times: Dict[str, List[float]] = defaultdict(list)
-        self.system_metrics: deque = deque(maxlen=1000)
+        # Run one call in sample_rate of each function under cProfile; the rest are only timed
+        self._sample_rate = max(sample_rate, 1)
+        self.function_times: Dict[str, FunctionTimings] = defaultdict(FunctionTimings)
+        self.system_metrics = SystemMetricsHistory(maxlen=1000)
         self._lock = threading.Lock()
-        self._profiling_enabled = True
+        self._timing_locks = [threading.Lock() for _ in range(self.TIMING_LOCK_STRIPES)]
+        # Per-thread cProfile instance, cleared and reused across sampled calls
+        self._thread_state = threading.local()
+        # One-element list closed over by the wrappers, so the per-call check is a
+        # cell load and an index instead of attribute lookups on self
+        self._enabled = [PROFILING_ENABLED]
         
         # Start system metrics collection
         self._start_system_monitoring()
     
     def profile_function(self, func: Callable) -> Callable:
-        """Decorator to profile function performance."""
+        """Decorator to profile function performance.
+        
+        Sync functions are timed on every call and run under cProfile on sampled
+        calls. Async functions are only timed: cProfile hooks the whole thread, so
+        it would charge every coroutine interleaved on the event loop to the
+        awaited call. When PROFILING_ENABLED is off, the function is returned as is.
+        """
+        if not PROFILING_ENABLED:
+            return func
+        
+        enabled = self._enabled
+        call_counter = itertools.count()
+        timing_lock = self._timing_lock(func.__name__)
+        
         @wraps(func)
         def sync_wrapper(*args, **kwargs):
-            if not self._profiling_enabled:
+            if not enabled[0]:
                 return func(*args, **kwargs)
             
-            start_time = time.time()
-            profiler = cProfile.Profile()
+            start_ns = time.perf_counter_ns()
+            
+            # Calls between samples only record their execution time
+            if next(call_counter) % self._sample_rate:
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    logger.error(f"Error profiling function {func.__name__}: {e}")
+                    raise e
+                
+                with timing_lock:
+                    self.function_times[func.__name__].add(time.perf_counter_ns() - start_ns)
+                
+                return result
+            
+            # Reuse this thread's profiler. It is detached while in use, so a nested
+            # sampled call builds its own rather than clearing this one mid-run
+            profiler = getattr(self._thread_state, 'profiler', None)
+            if profiler is None:
+                profiler = cProfile.Profile()
+            else:
+                del self._thread_state.profiler
             
             try:
+                if _TRACE_MARKER_FD is not None:
+                    _write_trace_marker(f"B|{os.getpid()}|{func.__name__}")
                 profiler.enable()
                 result = func(*args, **kwargs)
                 profiler.disable()
+                if _TRACE_MARKER_FD is not None:
+                    _write_trace_marker(f"E|{os.getpid()}")
                 
-                end_time = time.time()
-                execution_time = end_time - start_time
+                execution_ns = time.perf_counter_ns() - start_ns
                 
                 # Store timing data
-                with self._lock:
-                    self.function_times[func.__name__].append(execution_time)
+                with timing_lock:
+                    self.function_times[func.__name__].add(execution_ns)
                 
                 # Generate profile
-                self._generate_profile(func.__name__, profiler, execution_time)
+                self._generate_profile(func.__name__, profiler, execution_ns)
                 
                 return result
                 
             except Exception as e:
                 profiler.disable()
+                if _TRACE_MARKER_FD is not None:
+                    _write_trace_marker(f"E|{os.getpid()}")
                 logger.error(f"Error profiling function {func.__name__}: {e}")
                 raise e
+            finally:
+                profiler.clear()
+                self._thread_state.profiler = profiler
         
         @wraps(func)
         async def async_wrapper(*args, **kwargs):
-            if not self._profiling_enabled:
+            if not enabled[0]:
                 return await func(*args, **kwargs)
             
-            start_time = time.time()
+            # Timing only, no cProfile (see the docstring above)
+            start_ns = time.perf_counter_ns()
             
             try:
                 result = await func(*args, **kwargs)
-                end_time = time.time()
-                execution_time = end_time - start_time
+                execution_ns = time.perf_counter_ns() - start_ns
                 
                 # Store timing data
-                with self._lock:
-                    self.function_times[func.__name__].append(execution_time)
+                with timing_lock:
+                    self.function_times[func.__name__].add(execution_ns)
                 
                 return result
                 
@@ -108,45 +258,27 @@ class PerformanceProfiler:
         
         return async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper
     
-    def _generate_profile(self, function_name: str, profiler: cProfile.Profile, execution_time: float):
+    def _generate_profile(self, function_name: str, profiler: cProfile.Profile, execution_ns: int):
         """Generate and store performance profile."""
         try:
-            # Get profile statistics
-            s = io.StringIO()
-            ps = pstats.Stats(profiler, stream=s).sort_stats('cumulative')
-            ps.print_stats(10)  # Top 10 functions
-            
-            profile_data = s.getvalue()
-            
-            # Parse profile data to extract key metrics
-            lines = profile_data.split('\n')
+            # Read the raw stats table: (primitive calls, total calls, own time,
+            # cumulative time, callers) per function
+            ps = pstats.Stats(profiler)
             total_calls = 0
             cumulative_time = 0.0
             
-            for line in lines:
-                if 'function calls' in line and 'primitive calls' in line:
-                    # Extract total calls
-                    parts = line.split()
-                    if len(parts) > 0:
-                        total_calls = int(parts[0])
-                elif line.strip() and not line.startswith(' ') and 'function' not in line:
-                    # Parse function line
-                    parts = line.split()
-                    if len(parts) >= 4:
-                        try:
-                            calls = int(parts[0])
-                            cumulative = float(parts[3])
-                            cumulative_time = max(cumulative_time, cumulative)
-                        except (ValueError, IndexError):
-                            continue
+            for _, calls, _, cumulative, _ in ps.stats.values():
+                total_calls += calls
+                if cumulative > cumulative_time:
+                    cumulative_time = cumulative
             
             # Create profile record
             profile = PerformanceProfile(
                 function_name=function_name,
-                total_time=execution_time,
+                total_time=execution_ns / 1e9,
                 cumulative_time=cumulative_time,
                 calls=total_calls,
-                avg_time_per_call=execution_time / max(total_calls, 1),
+                avg_time_per_call=execution_ns // max(total_calls, 1) / 1e9,
                 percentage=100.0,  # Will be calculated relative to other functions
                 timestamp=datetime.now()
             )
@@ -154,7 +286,7 @@ class PerformanceProfiler:
             with self._lock:
                 self.profiles.append(profile)
             
-            logger.debug(f"Profiled {function_name}: {execution_time:.4f}s, {total_calls} calls")
+            logger.debug(f"Profiled {function_name}: {execution_ns / 1e9:.4f}s, {total_calls} calls")
             
         except Exception as e:
             logger.error(f"Error generating profile for {function_name}: {e}")
@@ -162,10 +294,16 @@ class PerformanceProfiler:
     def _start_system_monitoring(self):
         """Start background system metrics collection."""
         def collect_metrics():
+            # Prime the CPU counters; later non-blocking calls report usage since
+            # the previous call, i.e. over the sleep between collections
+            psutil.cpu_percent(interval=None)
+            disk_usage_percent = 0.0
+            iteration = 0
+            
             while True:
                 try:
                     # CPU usage
-                    cpu_percent = psutil.cpu_percent(interval=1)
+                    cpu_percent = psutil.cpu_percent(interval=None)
                     
                     # Memory usage
                     memory = psutil.virtual_memory()
@@ -173,9 +311,11 @@ class PerformanceProfiler:
                     memory_used_mb = memory.used / (1024 * 1024)
                     memory_available_mb = memory.available / (1024 * 1024)
                     
-                    # Disk usage
-                    disk = psutil.disk_usage('/')
-                    disk_usage_percent = (disk.used / disk.total) * 100
+                    # Disk usage changes slowly, so it is only refreshed every few collections
+                    if iteration % self.DISK_USAGE_REFRESH_INTERVAL == 0:
+                        disk = psutil.disk_usage('/')
+                        disk_usage_percent = (disk.used / disk.total) * 100
+                    iteration += 1
                     
                     metrics = SystemMetrics(
                         cpu_percent=cpu_percent,
@@ -199,12 +339,19 @@ class PerformanceProfiler:
         monitor_thread = threading.Thread(target=collect_metrics, daemon=True)
         monitor_thread.start()
     
+    def _timing_lock(self, function_name: str) -> threading.Lock:
+        """Lock stripe guarding the timing record of this function."""
+        return self._timing_locks[hash(function_name) % self.TIMING_LOCK_STRIPES]
+    
     def get_function_stats(self, function_name: str) -> Dict[str, Any]:
         """Get performance statistics for a specific function."""
-        with self._lock:
-            times = self.function_times.get(function_name, [])
+        with self._timing_lock(function_name):
+            timings = self.function_times.get(function_name)
+            if timings is not None:
+                stats = timings.summary()
+                recent_ns = list(timings.recent_ns)
         
-        if not times:
+        if timings is None:
             return {
                 'function_name': function_name,
                 'call_count': 0,
@@ -216,28 +363,23 @@ class PerformanceProfiler:
         
         return {
             'function_name': function_name,
-            'call_count': len(times),
-            'avg_time': sum(times) / len(times),
-            'min_time': min(times),
-            'max_time': max(times),
-            'total_time': sum(times),
-            'recent_times': times[-10:]  # Last 10 calls
+            **stats,
+            'recent_times': [t / 1e9 for t in recent_ns]  # Last 10 calls
         }
     
     def get_slowest_functions(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get the slowest functions by average execution time."""
         function_stats = []
         
-        with self._lock:
-            for func_name, times in self.function_times.items():
-                if times:
-                    avg_time = sum(times) / len(times)
-                    function_stats.append({
-                        'function_name': func_name,
-                        'avg_time': avg_time,
-                        'call_count': len(times),
-                        'total_time': sum(times)
-                    })
+        # Snapshot the entries first; each is then read under its own stripe
+        for func_name, timings in list(self.function_times.items()):
+            with self._timing_lock(func_name):
+                function_stats.append({
+                    'function_name': func_name,
+                    'avg_time': timings.total_ns / timings.count / 1e9,
+                    'call_count': timings.count,
+                    'total_time': timings.total_ns / 1e9
+                })
         
         # Sort by average time (descending)
         function_stats.sort(key=lambda x: x['avg_time'], reverse=True)
@@ -250,30 +392,23 @@ class PerformanceProfiler:
             if not self.system_metrics:
                 return {'error': 'No system metrics available'}
             
-            recent_metrics = list(self.system_metrics)[-10:]  # Last 10 measurements
+            # Last 10 measurements, one row per metric
+            recent_metrics, timestamp = self.system_metrics.recent(10)
         
         # Calculate averages
-        avg_cpu = sum(m.cpu_percent for m in recent_metrics) / len(recent_metrics)
-        avg_memory = sum(m.memory_percent for m in recent_metrics) / len(recent_metrics)
-        avg_disk = sum(m.disk_usage_percent for m in recent_metrics) / len(recent_metrics)
+        avg_cpu, avg_memory, _, _, avg_disk = recent_metrics.mean(axis=1).tolist()
         
         # Get current values
-        current = recent_metrics[-1]
+        current = recent_metrics[:, -1].tolist()
         
         return {
-            'current': {
-                'cpu_percent': current.cpu_percent,
-                'memory_percent': current.memory_percent,
-                'memory_used_mb': current.memory_used_mb,
-                'memory_available_mb': current.memory_available_mb,
-                'disk_usage_percent': current.disk_usage_percent
-            },
+            'current': dict(zip(SystemMetricsHistory.FIELDS, current)),
             'averages': {
                 'cpu_percent': round(avg_cpu, 2),
                 'memory_percent': round(avg_memory, 2),
                 'disk_usage_percent': round(avg_disk, 2)
             },
-            'timestamp': current.timestamp.isoformat()
+            'timestamp': timestamp.isoformat()
         }
     
     def get_performance_report(self) -> Dict[str, Any]:
@@ -295,7 +430,7 @@ class PerformanceProfiler:
             'summary': {
                 'total_profiles': total_profiles,
                 'total_functions_monitored': total_functions,
-                'profiling_enabled': self._profiling_enabled
+                'profiling_enabled': self._enabled[0]
             },
             'slowest_functions': slowest_functions,
             'system_metrics': system_metrics,
@@ -306,50 +441,57 @@ class PerformanceProfiler:
     def _calculate_performance_trends(self) -> Dict[str, Any]:
         """Calculate performance trends over time."""
         with self._lock:
-            recent_profiles = list(self.profiles)[-20:]  # Last 20 profiles
+            # Last 20 profiles, read from the right end without copying the whole deque
+            recent_profiles = list(itertools.islice(reversed(self.profiles), 20))[::-1]
         
         if len(recent_profiles) < 2:
             return {'trend': 'insufficient_data'}
         
-        # Calculate trend for total execution time
-        recent_times = [p.total_time for p in recent_profiles]
-        older_times = recent_times[:len(recent_times)//2]
-        newer_times = recent_times[len(recent_times)//2:]
+        # Calculate trend for total execution time; with at least two samples
+        # both halves are non-empty
+        recent_times = np.fromiter((p.total_time for p in recent_profiles), np.float64, len(recent_profiles))
+        half = len(recent_times) // 2
+        avg_older = recent_times[:half].mean()
+        avg_newer = recent_times[half:].mean()
         
-        if older_times and newer_times:
-            avg_older = sum(older_times) / len(older_times)
-            avg_newer = sum(newer_times) / len(newer_times)
-            
-            if avg_newer > avg_older * 1.1:
-                trend = 'degrading'
-            elif avg_newer < avg_older * 0.9:
-                trend = 'improving'
-            else:
-                trend = 'stable'
+        if avg_newer > avg_older * 1.1:
+            trend = 'degrading'
+        elif avg_newer < avg_older * 0.9:
+            trend = 'improving'
         else:
             trend = 'stable'
         
         return {
             'trend': trend,
-            'recent_avg_time': sum(recent_times) / len(recent_times),
+            'recent_avg_time': float(recent_times.mean()),
             'samples_analyzed': len(recent_profiles)
         }
     
     def enable_profiling(self):
         """Enable performance profiling."""
-        self._profiling_enabled = True
+        if not PROFILING_ENABLED:
+            logger.warning("Profiling is turned off by PROFILING_ENABLED; decorated functions are not wrapped")
+            return
+        self._enabled[0] = True
         logger.info("Performance profiling enabled")
     
     def disable_profiling(self):
         """Disable performance profiling."""
-        self._profiling_enabled = False
+        self._enabled[0] = False
         logger.info("Performance profiling disabled")
     
     def clear_profiles(self):
         """Clear all stored profiles."""
         with self._lock:
             self.profiles.clear()
+        
+        for lock in self._timing_locks:
+            lock.acquire()
+        try:
             self.function_times.clear()
+        finally:
+            for lock in self._timing_locks:
+                lock.release()
         logger.info("Performance profiles cleared")
 
 class FeatureEngineeringProfiler:
@@ -357,24 +499,23 @@ class FeatureEngineeringProfiler:
     
     def __init__(self, profiler: PerformanceProfiler):
         self.profiler = profiler
-        self.feature_times: Dict[str, List[float]] = defaultdict(list)
+        self.feature_times: Dict[str, FunctionTimings] = defaultdict(FunctionTimings)
     
     def profile_feature_engineering(self, func: Callable) -> Callable:
         """Profile feature engineering functions."""
         @wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = time.time()
+            start_ns = time.perf_counter_ns()
             
             try:
                 result = func(*args, **kwargs)
-                end_time = time.time()
-                execution_time = end_time - start_time
+                execution_ns = time.perf_counter_ns() - start_ns
                 
                 # Store feature engineering specific metrics
-                self.feature_times[func.__name__].append(execution_time)
+                self.feature_times[func.__name__].add(execution_ns)
                 
                 # Log feature engineering completion
-                logger.info(f"Feature engineering {func.__name__} completed in {execution_time:.4f}s")
+                logger.info(f"Feature engineering {func.__name__} completed in {execution_ns / 1e9:.4f}s")
                 
                 return result
                 
@@ -386,19 +527,10 @@ class FeatureEngineeringProfiler:
     
     def get_feature_engineering_stats(self) -> Dict[str, Any]:
         """Get feature engineering performance statistics."""
-        stats = {}
-        
-        for func_name, times in self.feature_times.items():
-            if times:
-                stats[func_name] = {
-                    'call_count': len(times),
-                    'avg_time': sum(times) / len(times),
-                    'min_time': min(times),
-                    'max_time': max(times),
-                    'total_time': sum(times)
-                }
-        
-        return stats
+        return {
+            func_name: timings.summary()
+            for func_name, timings in self.feature_times.items()
+        }
 
 # Global profiler instances
 performance_profiler = PerformanceProfiler()
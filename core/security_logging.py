@@ -1,34 +1,128 @@
 """
 Comprehensive security event logging system.
 """
-import json
+import glob
+import queue
+import threading
 import time
-from datetime import datetime
+import zipfile
+from datetime import datetime, timezone
 from typing import Dict, Any, Optional
 from fastapi import Request
 from loguru import logger
+import orjson
 import os
 import hashlib
 
+# Event details come from many call sites; tolerate non-string keys and
+# stringify values orjson can't encode rather than losing the event
+_JSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+def _dumps(obj: Any, option: int = 0) -> bytes:
+    """Encode an event or its details as compact JSON bytes."""
+    return orjson.dumps(obj, default=str, option=_JSON_OPTIONS | option)
+
+# (epoch second, "YYYY-MM-DDTHH:MM:SS") of the last event, so the date and time are
+# only formatted once per second. Racing threads can only write the same value.
+_timestamp_cache = [0, ""]
+
+def _utc_timestamp() -> str:
+    """Current UTC time in the format of datetime.utcnow().isoformat()."""
+    now = time.time()
+    second = int(now)
+    if _timestamp_cache[0] != second:
+        _timestamp_cache[1] = datetime.fromtimestamp(second, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        _timestamp_cache[0] = second
+    return f"{_timestamp_cache[1]}.{int((now - second) * 1_000_000):06d}"
+
 class SecurityLogger:
     """Centralized security event logging."""
     
+    # Most queued event lines written out in one writelines call
+    WRITE_BATCH_SIZE = 1000
+    
+    # The event file is archived as a zip once a day, and archives are kept for 30 days
+    ROTATION_INTERVAL = 24 * 60 * 60
+    RETENTION_PERIOD = 30 * 24 * 60 * 60
+    
+    # Fixed leading fields of attack events, which arrive in floods during an attack
+    _SQL_INJECTION_EVENT = {"event_type": "sql_injection_attempt", "severity": "CRITICAL", "user_id": None}
+    _XSS_EVENT = {"event_type": "xss_attempt", "severity": "CRITICAL", "user_id": None}
+    
+    # Console log method per severity; anything else is logged at INFO
+    _CONSOLE_LOG_METHODS = {
+        "CRITICAL": logger.critical,
+        "ERROR": logger.error,
+        "WARNING": logger.warning
+    }
+    
     def __init__(self):
         self.log_file = os.getenv("SECURITY_LOG_FILE", "security_events.log")
         self.enable_file_logging = os.getenv("ENABLE_SECURITY_FILE_LOGGING", "true").lower() == "true"
         self.enable_console_logging = os.getenv("ENABLE_SECURITY_CONSOLE_LOGGING", "true").lower() == "true"
         
-        # Configure security-specific logger
+        # Events are queued as encoded JSON lines and appended to one buffered
+        # file handle by a background thread, off the request path
+        self._write_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
         if self.enable_file_logging:
-            logger.add(
-                self.log_file,
-                format="{time:YYYY-MM-DD HH:mm:ss.SSS} | {level} | {message}",
-                level="WARNING",
-                filter=lambda record: "SECURITY_EVENT" in record["message"],
-                rotation="1 day",
-                retention="30 days",
-                compression="zip"
-            )
+            self._open_file()
+            self._writer = threading.Thread(target=self._write_events, daemon=True)
+            self._writer.start()
+    
+    def _write_events(self):
+        """Drain queued event lines in batches until close() queues the None sentinel."""
+        closing = False
+        while not closing:
+            batch = [self._write_queue.get()]
+            while len(batch) < self.WRITE_BATCH_SIZE and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+            
+            if None in batch:
+                closing = True
+                batch = [line for line in batch if line is not None]
+            
+            try:
+                if time.time() >= self._rotate_at:
+                    self._rotate_file()
+                self._file.writelines(batch)
+                # Flush whenever the queue runs dry, so an idle logger leaves nothing buffered
+                if closing or self._write_queue.empty():
+                    self._file.flush()
+            except OSError as e:
+                logger.error(f"Error writing security events: {e}")
+        
+        self._file.close()
+    
+    def _open_file(self):
+        """Open the event file for appending and schedule its next rotation."""
+        self._file = open(self.log_file, "ab", buffering=64 * 1024)
+        self._rotate_at = time.time() + self.ROTATION_INTERVAL
+    
+    def _rotate_file(self):
+        """Archive the event file as a zip, start a new one and drop expired archives."""
+        self._file.close()
+        try:
+            archived = f"{self.log_file}.{datetime.now(timezone.utc).strftime('%Y-%m-%d_%H-%M-%S')}"
+            os.replace(self.log_file, archived)
+            with zipfile.ZipFile(f"{archived}.zip", "w", zipfile.ZIP_DEFLATED) as archive:
+                archive.write(archived, os.path.basename(self.log_file))
+            os.remove(archived)
+            
+            cutoff = time.time() - self.RETENTION_PERIOD
+            for path in glob.glob(f"{glob.escape(self.log_file)}.*.zip"):
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+        finally:
+            # Keep logging even when archiving fails
+            self._open_file()
+    
+    def close(self):
+        """Write out queued events and close the log file."""
+        if self._writer is not None:
+            self._write_queue.put(None)
+            self._writer.join(timeout=5)
+            self._writer = None
     
     def log_security_event(
         self,
@@ -48,15 +142,13 @@ class SecurityLogger:
             user_agent = user_agent or request.headers.get("User-Agent", "")
             path = request.url.path
             method = request.method
-            headers = dict(request.headers)
         else:
             path = details.get("path") if details else None
             method = details.get("method") if details else None
-            headers = details.get("headers") if details else {}
         
         # Create security event
-        security_event = {
-            "timestamp": datetime.utcnow().isoformat(),
+        self._emit_event({
+            "timestamp": _utc_timestamp(),
             "event_type": event_type,
             "severity": severity,
             "user_id": user_id,
@@ -66,36 +158,45 @@ class SecurityLogger:
             "method": method,
             "details": details or {},
             "event_id": self._generate_event_id(event_type, ip_address, user_id)
-        }
+        })
+    
+    def _log_attack_event(self, skeleton: Dict[str, Any], ip_address: str, user_agent: str, details: Dict[str, Any]):
+        """Log an attack event from its precomputed skeleton, skipping the generic argument handling."""
+        self._emit_event({
+            "timestamp": _utc_timestamp(),
+            **skeleton,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "path": details.get("path") if details else None,
+            "method": details.get("method") if details else None,
+            "details": details or {},
+            "event_id": self._generate_event_id(skeleton["event_type"], ip_address, None)
+        })
+    
+    def _emit_event(self, security_event: Dict[str, Any]):
+        """Send a built security event to the console and the event file."""
         
         # Log to console
         if self.enable_console_logging:
-            log_message = f"SECURITY_EVENT: {event_type}"
-            if user_id:
-                log_message += f" - User: {user_id}"
-            if ip_address:
-                log_message += f" - IP: {ip_address}"
-            if details:
-                log_message += f" - Details: {json.dumps(details)}"
+            message_parts = [f"SECURITY_EVENT: {security_event['event_type']}"]
+            if security_event["user_id"]:
+                message_parts.append(f" - User: {security_event['user_id']}")
+            if security_event["ip_address"]:
+                message_parts.append(f" - IP: {security_event['ip_address']}")
+            if security_event["details"]:
+                message_parts.append(f" - Details: {_dumps(security_event['details']).decode()}")
             
-            if severity == "CRITICAL":
-                logger.critical(log_message)
-            elif severity == "ERROR":
-                logger.error(log_message)
-            elif severity == "WARNING":
-                logger.warning(log_message)
-            else:
-                logger.info(log_message)
+            self._CONSOLE_LOG_METHODS.get(security_event["severity"], logger.info)("".join(message_parts))
         
         # Log to file
         if self.enable_file_logging:
-            with open(self.log_file, "a") as f:
-                f.write(json.dumps(security_event) + "\n")
+            self._write_queue.put(_dumps(security_event, orjson.OPT_APPEND_NEWLINE))
     
     def _generate_event_id(self, event_type: str, ip_address: Optional[str], user_id: Optional[str]) -> str:
         """Generate a unique event ID."""
         data = f"{event_type}_{ip_address}_{user_id}_{time.time()}"
-        return hashlib.md5(data.encode()).hexdigest()[:16]
+        # An 8-byte BLAKE2b digest is exactly the 16 hex characters wanted
+        return hashlib.blake2b(data.encode(), digest_size=8).hexdigest()
     
     # Specific security event methods
     def log_authentication_failure(self, ip_address: str, user_agent: str, details: Dict[str, Any]):
@@ -187,23 +288,11 @@ class SecurityLogger:
     
     def log_sql_injection_attempt(self, ip_address: str, user_agent: str, details: Dict[str, Any]):
         """Log SQL injection attempts."""
-        self.log_security_event(
-            event_type="sql_injection_attempt",
-            severity="CRITICAL",
-            ip_address=ip_address,
-            user_agent=user_agent,
-            details=details
-        )
+        self._log_attack_event(self._SQL_INJECTION_EVENT, ip_address, user_agent, details)
     
     def log_xss_attempt(self, ip_address: str, user_agent: str, details: Dict[str, Any]):
         """Log XSS attempts."""
-        self.log_security_event(
-            event_type="xss_attempt",
-            severity="CRITICAL",
-            ip_address=ip_address,
-            user_agent=user_agent,
-            details=details
-        )
+        self._log_attack_event(self._XSS_EVENT, ip_address, user_agent, details)
     
     def log_file_upload_attempt(self, user_id: str, ip_address: str, file_details: Dict[str, Any]):
         """Log file upload attempts."""
@@ -230,44 +319,15 @@ class SecurityLogger:
 # Global security logger instance
 security_logger = SecurityLogger()
 
-# Convenience functions
-def log_auth_failure(ip_address: str, user_agent: str, details: Dict[str, Any]):
-    """Log authentication failure."""
-    security_logger.log_authentication_failure(ip_address, user_agent, details)
-
-def log_auth_success(user_id: str, ip_address: str, user_agent: str):
-    """Log successful authentication."""
-    security_logger.log_authentication_success(user_id, ip_address, user_agent)
-
-def log_rate_limit(ip_address: str, user_id: Optional[str], limit_type: str):
-    """Log rate limit exceeded."""
-    security_logger.log_rate_limit_exceeded(ip_address, user_id, limit_type)
-
-def log_suspicious_activity(event_type: str, ip_address: str, details: Dict[str, Any]):
-    """Log suspicious activity."""
-    security_logger.log_suspicious_activity(event_type, ip_address, details)
-
-def log_data_access(user_id: str, resource_type: str, action: str, details: Dict[str, Any]):
-    """Log data access."""
-    security_logger.log_data_access(user_id, resource_type, action, details)
-
-def log_privilege_escalation(user_id: str, ip_address: str, details: Dict[str, Any]):
-    """Log privilege escalation attempt."""
-    security_logger.log_privilege_escalation_attempt(user_id, ip_address, details)
-
-def log_session_anomaly(user_id: str, ip_address: str, anomaly_type: str, details: Dict[str, Any]):
-    """Log session anomaly."""
-    security_logger.log_session_anomaly(user_id, ip_address, anomaly_type, details)
-
-def log_input_validation_failure(ip_address: str, validation_errors: list, details: Dict[str, Any]):
-    """Log input validation failure."""
-    security_logger.log_input_validation_failure(ip_address, validation_errors, details)
-
-def log_sql_injection(ip_address: str, user_agent: str, details: Dict[str, Any]):
-    """Log SQL injection attempt."""
-    security_logger.log_sql_injection_attempt(ip_address, user_agent, details)
-
-def log_xss_attempt(ip_address: str, user_agent: str, details: Dict[str, Any]):
-    """Log XSS attempt."""
-    security_logger.log_xss_attempt(ip_address, user_agent, details)
-
+# Convenience functions, bound to the global instance's methods once at import
+# (every helper takes the same arguments in the same order as its method)
+log_auth_failure = security_logger.log_authentication_failure
+log_auth_success = security_logger.log_authentication_success
+log_rate_limit = security_logger.log_rate_limit_exceeded
+log_suspicious_activity = security_logger.log_suspicious_activity
+log_data_access = security_logger.log_data_access
+log_privilege_escalation = security_logger.log_privilege_escalation_attempt
+log_session_anomaly = security_logger.log_session_anomaly
+log_input_validation_failure = security_logger.log_input_validation_failure
+log_sql_injection = security_logger.log_sql_injection_attempt
+log_xss_attempt = security_logger.log_xss_attempt
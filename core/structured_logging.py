@@ -4,34 +4,133 @@ Essential for tracking 450 trucks and debugging issues efficiently.
 """
 
 import structlog
+import atexit
 import json
+import logging
+import orjson
+import os
+import queue
+import sys
+import threading
 import time
-from typing import Dict, Any, Optional, List
-from datetime import datetime
-from contextvars import ContextVar
+from typing import Dict, Any, Optional, List, Callable
+from collections import OrderedDict
+from contextvars import ContextVar, Token
 from loguru import logger
 
+from .logging import LOG_LEVEL
+
 # Context variables for request tracking
 request_id_var: ContextVar[Optional[str]] = ContextVar('request_id', default=None)
-user_id_var: ContextVar[Optional[str]] = ContextVar('user_id', default=None)
-machine_id_var: ContextVar[Optional[str]] = ContextVar('machine_id', default=None)
 
-# Configure structured logging
+# Non-None request_id / user_id / machine_id of the current request, merged into
+# every structured event; built once per request rather than read per event
+request_context_var: ContextVar[Dict[str, Any]] = ContextVar('request_context', default={})
+
+def bind_request_context(**values) -> Token:
+    """Set the current request's logging context, keeping only non-None values."""
+    return request_context_var.set({k: v for k, v in values.items() if v is not None})
+
+def _orjson_renderer(_, __, event_dict: Dict[str, Any]) -> bytes:
+    """Render an event as a JSON line in bytes, ready for BytesLogger."""
+    return orjson.dumps(event_dict, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+
+class QueuedBytesLogger:
+    """Stand-in for structlog's BytesLogger that hands rendered lines to a background writer.
+    
+    Request handlers only enqueue; a daemon thread writes the lines out in batches. When
+    the queue is full the line is dropped and counted rather than blocking the caller.
+    """
+    
+    # Most queued lines written out in one write call
+    WRITE_BATCH_SIZE = 1000
+    
+    def __init__(self, file=None, maxsize: int = 10000):
+        self._file = file or sys.stdout.buffer
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self._writer: Optional[threading.Thread] = threading.Thread(target=self._write_lines, daemon=True)
+        self._writer.start()
+    
+    def msg(self, message: bytes):
+        """Queue one rendered event."""
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+    
+    log = debug = info = warn = warning = msg
+    fatal = failure = err = error = critical = exception = msg
+    
+    def _write_lines(self):
+        """Drain queued lines in batches until close() queues the None sentinel."""
+        closing = False
+        while not closing:
+            batch = [self._queue.get()]
+            while len(batch) < self.WRITE_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            
+            if None in batch:
+                closing = True
+                batch = [line for line in batch if line is not None]
+            
+            try:
+                if batch:
+                    self._file.write(b"\n".join(batch) + b"\n")
+                # Flush whenever the queue runs dry, so an idle logger leaves nothing buffered
+                if closing or self._queue.empty():
+                    self._file.flush()
+            except (OSError, ValueError) as e:
+                logger.error(f"Error writing structured log lines: {e}")
+    
+    def close(self):
+        """Write out queued lines and stop the writer thread."""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+            self._writer = None
+
+# Numeric level events are filtered at, fixed at startup like LOG_LEVEL itself.
+# The log_* helpers below check these before building their event fields.
+_LOG_LEVEL_NO = logging.getLevelNamesMapping().get(LOG_LEVEL, logging.INFO)
+_INFO_ENABLED = _LOG_LEVEL_NO <= logging.INFO
+_WARNING_ENABLED = _LOG_LEVEL_NO <= logging.WARNING
+
+# Second-resolution part of the event timestamp, rendered once per second
+_timestamp_cache = [0, ""]
+
+def _timestamper(_, __, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Stamp the event with the current UTC time, as TimeStamper(fmt="iso") would.
+    
+    Shared by the processor chain and the fast path so both stamp events alike.
+    """
+    now = time.time()
+    second = int(now)
+    if _timestamp_cache[0] != second:
+        _timestamp_cache[1] = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _timestamp_cache[0] = second
+    event_dict["timestamp"] = f"{_timestamp_cache[1]}.{int((now - second) * 1_000_000):06d}Z"
+    return event_dict
+
+# Single writer shared by every structlog logger
+log_writer = QueuedBytesLogger()
+atexit.register(log_writer.close)
+
+# Configure structured logging. Events are rendered with orjson and queued as
+# bytes for the background writer, bypassing the stdlib logging machinery; levels
+# below the application's LOG_LEVEL are dropped by the bound logger itself.
 structlog.configure(
     processors=[
-        structlog.stdlib.filter_by_level,
-        structlog.stdlib.add_logger_name,
-        structlog.stdlib.add_log_level,
-        structlog.stdlib.PositionalArgumentsFormatter(),
-        structlog.processors.TimeStamper(fmt="iso"),
+        structlog.processors.add_log_level,
+        _timestamper,
         structlog.processors.StackInfoRenderer(),
         structlog.processors.format_exc_info,
         structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
+        _orjson_renderer
     ],
     context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
+    logger_factory=lambda *args: log_writer,
+    wrapper_class=structlog.make_filtering_bound_logger(_LOG_LEVEL_NO),
     cache_logger_on_first_use=True,
 )
 
@@ -39,12 +138,14 @@ class StructuredLogger:
     """Enhanced structured logger with context awareness."""
     
     def __init__(self, name: str = "mining_pdm"):
-        self.logger = structlog.get_logger(name)
+        # The shared writer has no name of its own, so it is carried in the event
+        self.name = name
+        self.logger = structlog.get_logger().bind(logger=name)
         self._context = {}
     
     def bind_context(self, **kwargs) -> 'StructuredLogger':
         """Bind additional context to the logger."""
-        new_logger = StructuredLogger()
+        new_logger = StructuredLogger(self.name)
         new_logger.logger = self.logger.bind(**kwargs)
         new_logger._context = {**self._context, **kwargs}
         return new_logger
@@ -66,16 +167,27 @@ class StructuredLogger:
         self.logger.debug(message, **self._get_context(**kwargs))
     
     def _get_context(self, **kwargs) -> Dict[str, Any]:
-        """Get full context including request, user, and machine info."""
-        context = {
+        """Get full context including request, user, and machine info.
+        
+        The timestamp is added by the _timestamper processor.
+        """
+        return {**self._context, **kwargs, **request_context_var.get()}
+    
+    def _fast_emit(self, level: str, message: str, fields: Dict[str, Any]):
+        """Render a fixed-schema event straight to the log writer, skipping the processor chain.
+        
+        Produces the same line as the structlog pipeline. Callers check the level
+        themselves, and exceptions are not rendered, so error paths use the pipeline.
+        """
+        event_dict = {
+            "logger": self.name,
             **self._context,
-            **kwargs,
-            "request_id": request_id_var.get(),
-            "user_id": user_id_var.get(),
-            "machine_id": machine_id_var.get(),
-            "timestamp": datetime.utcnow().isoformat()
+            **fields,
+            **request_context_var.get(),
+            "event": message,
+            "level": level
         }
-        return {k: v for k, v in context.items() if v is not None}
+        log_writer.msg(_orjson_renderer(None, None, _timestamper(None, None, event_dict)))
 
 class TruckLogger:
     """Specialized logger for truck/machine operations."""
@@ -91,25 +203,33 @@ class TruckLogger:
     def log_telemetry_ingestion(self, data_points: int, processing_time: float, 
                                validation_status: str = "valid"):
         """Log telemetry data ingestion."""
-        self.logger.info("Telemetry ingested successfully",
-                        data_points=data_points,
-                        processing_time_ms=round(processing_time * 1000, 2),
-                        validation_status=validation_status,
-                        event_type="telemetry_ingestion")
+        if not _INFO_ENABLED:
+            return
+        self.logger._fast_emit("info", "Telemetry ingested successfully", {
+            "data_points": data_points,
+            "processing_time_ms": round(processing_time * 1000, 2),
+            "validation_status": validation_status,
+            "event_type": "telemetry_ingestion"
+        })
     
     def log_prediction(self, prediction: float, processing_time: float, 
                       model_version: str, confidence: Optional[float] = None):
         """Log prediction completion."""
-        self.logger.info("Prediction completed",
-                        prediction=round(prediction, 4),
-                        processing_time_ms=round(processing_time * 1000, 2),
-                        model_version=model_version,
-                        confidence=confidence,
-                        event_type="prediction")
+        if not _INFO_ENABLED:
+            return
+        self.logger._fast_emit("info", "Prediction completed", {
+            "prediction": round(prediction, 4),
+            "processing_time_ms": round(processing_time * 1000, 2),
+            "model_version": model_version,
+            "confidence": confidence,
+            "event_type": "prediction"
+        })
     
     def log_alert_generated(self, alert_type: str, severity: str, 
                            threshold_value: float, actual_value: float):
         """Log alert generation."""
+        if not _WARNING_ENABLED:
+            return
         self.logger.warning("Alert generated",
                            alert_type=alert_type,
                            severity=severity,
@@ -120,6 +240,8 @@ class TruckLogger:
     def log_maintenance_scheduled(self, maintenance_type: str, 
                                  scheduled_date: str, estimated_duration: int):
         """Log maintenance scheduling."""
+        if not _INFO_ENABLED:
+            return
         self.logger.info("Maintenance scheduled",
                         maintenance_type=maintenance_type,
                         scheduled_date=scheduled_date,
@@ -137,6 +259,8 @@ class TruckLogger:
     def log_performance_issue(self, metric: str, value: float, 
                              threshold: float, impact: str):
         """Log performance issues."""
+        if not _WARNING_ENABLED:
+            return
         self.logger.warning("Performance issue detected",
                            metric=metric,
                            value=value,
@@ -156,23 +280,36 @@ class APILogger:
             method=method,
             user_id=user_id
         )
+        # Leading fields of the completion event, which is logged for every request
+        self._complete_template = {"logger": self.logger.name, **self.logger._context}
     
     def log_request_start(self, request_id: str, **kwargs):
         """Log API request start."""
-        self.logger.info("API request started",
-                        request_id=request_id,
-                        event_type="request_start",
-                        **kwargs)
+        if not _INFO_ENABLED:
+            return
+        self.logger._fast_emit("info", "API request started", {
+            "request_id": request_id,
+            "event_type": "request_start",
+            **kwargs
+        })
     
     def log_request_complete(self, request_id: str, status_code: int, 
                            processing_time: float, **kwargs):
         """Log API request completion."""
-        self.logger.info("API request completed",
-                        request_id=request_id,
-                        status_code=status_code,
-                        processing_time_ms=round(processing_time * 1000, 2),
-                        event_type="request_complete",
-                        **kwargs)
+        if not _INFO_ENABLED:
+            return
+        # Fill a copy of the prebuilt fields rather than merging keyword dicts
+        event_dict = self._complete_template.copy()
+        event_dict["request_id"] = request_id
+        event_dict["status_code"] = status_code
+        event_dict["processing_time_ms"] = round(processing_time * 1000, 2)
+        event_dict["event_type"] = "request_complete"
+        if kwargs:
+            event_dict.update(kwargs)
+        event_dict.update(request_context_var.get())
+        event_dict["event"] = "API request completed"
+        event_dict["level"] = "info"
+        log_writer.msg(_orjson_renderer(None, None, _timestamper(None, None, event_dict)))
     
     def log_request_error(self, request_id: str, error: str, 
                          status_code: int, processing_time: float):
@@ -187,6 +324,8 @@ class APILogger:
     def log_rate_limit_hit(self, request_id: str, limit_type: str, 
                           remaining_requests: int):
         """Log rate limiting events."""
+        if not _WARNING_ENABLED:
+            return
         self.logger.warning("Rate limit exceeded",
                            request_id=request_id,
                            limit_type=limit_type,
@@ -202,16 +341,21 @@ class SystemLogger:
     def log_database_operation(self, operation: str, table: str, 
                               duration: float, rows_affected: int = 0):
         """Log database operations."""
-        self.logger.info("Database operation completed",
-                        operation=operation,
-                        table=table,
-                        duration_ms=round(duration * 1000, 2),
-                        rows_affected=rows_affected,
-                        event_type="database_operation")
+        if not _INFO_ENABLED:
+            return
+        self.logger._fast_emit("info", "Database operation completed", {
+            "operation": operation,
+            "table": table,
+            "duration_ms": round(duration * 1000, 2),
+            "rows_affected": rows_affected,
+            "event_type": "database_operation"
+        })
     
     def log_cache_operation(self, operation: str, key: str, 
                            hit: bool, duration: float):
         """Log cache operations."""
+        if not _INFO_ENABLED:
+            return
         self.logger.info("Cache operation completed",
                         operation=operation,
                         cache_key=key,
@@ -222,6 +366,8 @@ class SystemLogger:
     def log_model_operation(self, operation: str, model_version: str, 
                            duration: float, success: bool):
         """Log ML model operations."""
+        if not _INFO_ENABLED:
+            return
         self.logger.info("Model operation completed",
                         operation=operation,
                         model_version=model_version,
@@ -232,6 +378,8 @@ class SystemLogger:
     def log_system_health(self, component: str, status: str, 
                          metrics: Dict[str, Any]):
         """Log system health status."""
+        if not _INFO_ENABLED:
+            return
         self.logger.info("System health check",
                         component=component,
                         status=status,
@@ -246,13 +394,18 @@ class LoggingMiddleware:
     
     async def log_request(self, request, call_next):
         """Log incoming requests and responses."""
-        request_id = f"req_{int(time.time() * 1000)}"
-        request_id_var.set(request_id)
+        # Millisecond timestamps collided under load; random ids cannot, and need no float math
+        request_id = f"req_{os.urandom(6).hex()}"
+        request_id_token = request_id_var.set(request_id)
+        request_context_token = bind_request_context(
+            request_id=request_id,
+            user_id=getattr(request.state, 'user_id', None)
+        )
         
         start_time = time.time()
         
         # Log request start
-        api_logger = APILogger(
+        api_logger = get_api_logger(
             endpoint=request.url.path,
             method=request.method,
             user_id=getattr(request.state, 'user_id', None)
@@ -285,25 +438,57 @@ class LoggingMiddleware:
             )
             
             raise
+        finally:
+            # Keep this request's context out of work that runs after it
+            request_id_var.reset(request_id_token)
+            request_context_var.reset(request_context_token)
 
 # Global logger instances
 system_logger = SystemLogger()
 structured_logger = StructuredLogger()
 
+# Bound loggers are immutable once built, so each thread keeps the most recently
+# used ones per kind and context instead of binding new ones on every call
+LOGGER_CACHE_SIZE = 512
+_thread_loggers = threading.local()
+
+def _cached_logger(kind: str, key: tuple, factory: Callable):
+    """This thread's logger of the given kind for key, built by factory(*key) on a miss."""
+    cache = getattr(_thread_loggers, kind, None)
+    if cache is None:
+        cache = OrderedDict()
+        setattr(_thread_loggers, kind, cache)
+    
+    bound_logger = cache.get(key)
+    if bound_logger is None:
+        bound_logger = cache[key] = factory(*key)
+        if len(cache) > LOGGER_CACHE_SIZE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(key)
+    return bound_logger
+
 def get_truck_logger(machine_id: str, user_id: Optional[str] = None) -> TruckLogger:
     """Get a truck-specific logger."""
-    return TruckLogger(machine_id, user_id)
+    return _cached_logger("truck", (machine_id, user_id), TruckLogger)
 
 def get_api_logger(endpoint: str, method: str, user_id: Optional[str] = None) -> APILogger:
     """Get an API-specific logger."""
-    return APILogger(endpoint, method, user_id)
+    return _cached_logger("api", (endpoint, method, user_id), APILogger)
 
 def log_feature_engineering_completion(features_count: int, processing_time: float, 
                                      machine_id: Optional[str] = None):
     """Log feature engineering completion with context."""
-    logger = structured_logger.bind_context(
-        machine_id=machine_id,
-        event_type="feature_engineering"
+    if not _INFO_ENABLED:
+        return
+    
+    logger = _cached_logger(
+        "feature_engineering",
+        (machine_id,),
+        lambda machine_id: structured_logger.bind_context(
+            machine_id=machine_id,
+            event_type="feature_engineering"
+        )
     )
     
     logger.info("Feature engineering completed",
@@ -314,10 +499,17 @@ def log_prediction_metrics(prediction: float, confidence: float,
                           model_version: str, processing_time: float,
                           machine_id: str, user_id: Optional[str] = None):
     """Log prediction metrics with full context."""
-    logger = structured_logger.bind_context(
-        machine_id=machine_id,
-        user_id=user_id,
-        event_type="prediction_metrics"
+    if not _INFO_ENABLED:
+        return
+    
+    logger = _cached_logger(
+        "prediction_metrics",
+        (machine_id, user_id),
+        lambda machine_id, user_id: structured_logger.bind_context(
+            machine_id=machine_id,
+            user_id=user_id,
+            event_type="prediction_metrics"
+        )
     )
     
     logger.info("Prediction metrics",
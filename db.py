@@ -3,19 +3,66 @@ Database configuration and session management.
 """
 
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
 
 from .config import settings
 
-# Create database engine for SQLite
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False},
-    echo=settings.debug,
+# WAL lets readers run alongside the writer, and NORMAL sync only fsyncs at
+# checkpoints instead of on every commit
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
 )
 
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply SQLITE_PRAGMAS to each new SQLite connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+def get_engine(url: str = settings.database_url):
+    """Create an engine with pooling suited to the database backend."""
+    if not url.startswith("sqlite"):
+        # Keep warm connections to PostgreSQL, dropping dead or stale ones
+        return create_engine(
+            url,
+            echo=settings.debug,
+            query_cache_size=1200,
+            poolclass=QueuePool,
+            pool_size=20,
+            max_overflow=40,
+            pool_pre_ping=True,
+            pool_recycle=1800,
+        )
+    
+    # An in-memory database only exists on its one connection, so share it;
+    # file databases keep the default pool so threads don't share a connection
+    pool_options = {"poolclass": StaticPool} if ":memory:" in url or url == "sqlite://" else {}
+    sqlite_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        echo=settings.debug,
+        query_cache_size=1200,
+        **pool_options,
+    )
+    event.listen(sqlite_engine, "connect", set_sqlite_pragmas)
+    return sqlite_engine
+
+
+# Create database engine
+engine = get_engine()
+
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
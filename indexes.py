@@ -3,10 +3,159 @@ Database index optimization for handling 450 trucks efficiently.
 Creates indexes for optimal query performance with large datasets.
 """
 
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import Session
 from loguru import logger
-from typing import List, Dict, Any
+from dataclasses import dataclass
+from typing import List, Dict, Any, Tuple
+
+@dataclass(slots=True, frozen=True)
+class IndexSpec:
+    """A performance index and the table columns it needs."""
+    name: str
+    table: str
+    required_columns: Tuple[str, ...]
+    sql: str
+    description: str
+
+# Built once at import; create_performance_indexes only filters and executes these
+PERFORMANCE_INDEXES: Tuple[IndexSpec, ...] = (
+    # Telemetry table indexes - critical for 450 trucks
+    IndexSpec(
+        name="idx_telemetry_machine_timestamp",
+        table="telemetry",
+        required_columns=("machine_id", "timestamp"),
+        sql="CREATE INDEX IF NOT EXISTS idx_telemetry_machine_timestamp ON telemetry(machine_id, timestamp DESC)",
+        description="Optimizes queries filtering by machine and time range"
+    ),
+    IndexSpec(
+        name="idx_telemetry_timestamp",
+        table="telemetry",
+        required_columns=("timestamp",),
+        sql="CREATE INDEX IF NOT EXISTS idx_telemetry_timestamp ON telemetry(timestamp DESC)",
+        description="Optimizes time-based queries and sorting"
+    ),
+    IndexSpec(
+        name="idx_telemetry_machine_id",
+        table="telemetry",
+        required_columns=("machine_id",),
+        sql="CREATE INDEX IF NOT EXISTS idx_telemetry_machine_id ON telemetry(machine_id)",
+        description="Optimizes machine-specific queries"
+    ),
+    IndexSpec(
+        name="idx_telemetry_temperature",
+        table="telemetry",
+        required_columns=("temperature",),
+        sql="CREATE INDEX IF NOT EXISTS idx_telemetry_temperature ON telemetry(temperature)",
+        description="Optimizes temperature-based filtering and alerts"
+    ),
+    IndexSpec(
+        name="idx_telemetry_vibration",
+        table="telemetry",
+        required_columns=("vibration",),
+        sql="CREATE INDEX IF NOT EXISTS idx_telemetry_vibration ON telemetry(vibration)",
+        description="Optimizes vibration-based filtering and alerts"
+    ),
+    
+    # Machine table indexes
+    IndexSpec(
+        name="idx_machines_site",
+        table="machines",
+        required_columns=("site",),
+        sql="CREATE INDEX IF NOT EXISTS idx_machines_site ON machines(site)",
+        description="Optimizes site-based machine queries"
+    ),
+    IndexSpec(
+        name="idx_machines_model",
+        table="machines",
+        required_columns=("model",),
+        sql="CREATE INDEX IF NOT EXISTS idx_machines_model ON machines(model)",
+        description="Optimizes model-based machine queries"
+    ),
+    IndexSpec(
+        name="idx_machines_site_model",
+        table="machines",
+        required_columns=("site", "model"),
+        sql="CREATE INDEX IF NOT EXISTS idx_machines_site_model ON machines(site, model)",
+        description="Optimizes combined site and model queries"
+    ),
+    IndexSpec(
+        name="idx_machines_machine_id",
+        table="machines",
+        required_columns=("machine_id",),
+        sql="CREATE INDEX IF NOT EXISTS idx_machines_machine_id ON machines(machine_id)",
+        description="Optimizes machine ID lookups"
+    ),
+    
+    # Prediction table indexes
+    IndexSpec(
+        name="idx_predictions_machine_timestamp",
+        table="predictions",
+        required_columns=("machine_id", "timestamp"),
+        sql="CREATE INDEX IF NOT EXISTS idx_predictions_machine_timestamp ON predictions(machine_id, timestamp DESC)",
+        description="Optimizes prediction history queries"
+    ),
+    IndexSpec(
+        name="idx_predictions_timestamp",
+        table="predictions",
+        required_columns=("timestamp",),
+        sql="CREATE INDEX IF NOT EXISTS idx_predictions_timestamp ON predictions(timestamp DESC)",
+        description="Optimizes time-based prediction queries"
+    ),
+    IndexSpec(
+        name="idx_predictions_health_score",
+        table="predictions",
+        required_columns=("health_score",),
+        sql="CREATE INDEX IF NOT EXISTS idx_predictions_health_score ON predictions(health_score)",
+        description="Optimizes health score filtering and alerts"
+    ),
+    
+    # User and authentication indexes
+    IndexSpec(
+        name="idx_users_username",
+        table="users",
+        required_columns=("username",),
+        sql="CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)",
+        description="Optimizes username lookups for authentication"
+    ),
+    IndexSpec(
+        name="idx_users_email",
+        table="users",
+        required_columns=("email",),
+        sql="CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)",
+        description="Optimizes email lookups for authentication"
+    ),
+    IndexSpec(
+        name="idx_users_company_id",
+        table="users",
+        required_columns=("company_id",),
+        sql="CREATE INDEX IF NOT EXISTS idx_users_company_id ON users(company_id)",
+        description="Optimizes company-based user queries"
+    ),
+    
+    # Alert table indexes
+    IndexSpec(
+        name="idx_alerts_machine_timestamp",
+        table="alerts",
+        required_columns=("machine_id", "timestamp"),
+        sql="CREATE INDEX IF NOT EXISTS idx_alerts_machine_timestamp ON alerts(machine_id, timestamp DESC)",
+        description="Optimizes machine-specific alert queries"
+    ),
+    IndexSpec(
+        name="idx_alerts_status",
+        table="alerts",
+        required_columns=("status",),
+        sql="CREATE INDEX IF NOT EXISTS idx_alerts_status ON alerts(status)",
+        description="Optimizes alert status filtering"
+    ),
+    IndexSpec(
+        name="idx_alerts_severity",
+        table="alerts",
+        required_columns=("severity",),
+        sql="CREATE INDEX IF NOT EXISTS idx_alerts_severity ON alerts(severity)",
+        description="Optimizes alert severity filtering"
+    )
+)
 
 class DatabaseOptimizer:
     """Handles database optimization and index creation."""
@@ -17,198 +166,73 @@ class DatabaseOptimizer:
     def create_performance_indexes(self) -> Dict[str, Any]:
         """Create all performance indexes for optimal query speed."""
         
-        indexes = [
-            # Telemetry table indexes - critical for 450 trucks
-            {
-                "name": "idx_telemetry_machine_timestamp",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_telemetry_machine_timestamp ON telemetry(machine_id, timestamp DESC)",
-                "description": "Optimizes queries filtering by machine and time range",
-                "table": "telemetry",
-                "required_columns": ["machine_id", "timestamp"]
-            },
-            {
-                "name": "idx_telemetry_timestamp",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_telemetry_timestamp ON telemetry(timestamp DESC)",
-                "description": "Optimizes time-based queries and sorting",
-                "table": "telemetry",
-                "required_columns": ["timestamp"]
-            },
-            {
-                "name": "idx_telemetry_machine_id",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_telemetry_machine_id ON telemetry(machine_id)",
-                "description": "Optimizes machine-specific queries",
-                "table": "telemetry",
-                "required_columns": ["machine_id"]
-            },
-            {
-                "name": "idx_telemetry_temperature",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_telemetry_temperature ON telemetry(temperature)",
-                "description": "Optimizes temperature-based filtering and alerts",
-                "table": "telemetry",
-                "required_columns": ["temperature"]
-            },
-            {
-                "name": "idx_telemetry_vibration",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_telemetry_vibration ON telemetry(vibration)",
-                "description": "Optimizes vibration-based filtering and alerts",
-                "table": "telemetry",
-                "required_columns": ["vibration"]
-            },
-            
-            # Machine table indexes
-            {
-                "name": "idx_machines_site",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_machines_site ON machines(site)",
-                "description": "Optimizes site-based machine queries",
-                "table": "machines",
-                "required_columns": ["site"]
-            },
-            {
-                "name": "idx_machines_model",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_machines_model ON machines(model)",
-                "description": "Optimizes model-based machine queries",
-                "table": "machines",
-                "required_columns": ["model"]
-            },
-            {
-                "name": "idx_machines_site_model",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_machines_site_model ON machines(site, model)",
-                "description": "Optimizes combined site and model queries",
-                "table": "machines",
-                "required_columns": ["site", "model"]
-            },
-            {
-                "name": "idx_machines_machine_id",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_machines_machine_id ON machines(machine_id)",
-                "description": "Optimizes machine ID lookups",
-                "table": "machines",
-                "required_columns": ["machine_id"]
-            },
-            
-            # Prediction table indexes
-            {
-                "name": "idx_predictions_machine_timestamp",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_predictions_machine_timestamp ON predictions(machine_id, timestamp DESC)",
-                "description": "Optimizes prediction history queries",
-                "table": "predictions",
-                "required_columns": ["machine_id", "timestamp"]
-            },
-            {
-                "name": "idx_predictions_timestamp",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_predictions_timestamp ON predictions(timestamp DESC)",
-                "description": "Optimizes time-based prediction queries",
-                "table": "predictions",
-                "required_columns": ["timestamp"]
-            },
-            {
-                "name": "idx_predictions_health_score",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_predictions_health_score ON predictions(health_score)",
-                "description": "Optimizes health score filtering and alerts",
-                "table": "predictions",
-                "required_columns": ["health_score"]
-            },
-            
-            # User and authentication indexes
-            {
-                "name": "idx_users_username",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)",
-                "description": "Optimizes username lookups for authentication",
-                "table": "users",
-                "required_columns": ["username"]
-            },
-            {
-                "name": "idx_users_email",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)",
-                "description": "Optimizes email lookups for authentication",
-                "table": "users",
-                "required_columns": ["email"]
-            },
-            {
-                "name": "idx_users_company_id",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_users_company_id ON users(company_id)",
-                "description": "Optimizes company-based user queries",
-                "table": "users",
-                "required_columns": ["company_id"]
-            },
-            
-            # Alert table indexes
-            {
-                "name": "idx_alerts_machine_timestamp",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_alerts_machine_timestamp ON alerts(machine_id, timestamp DESC)",
-                "description": "Optimizes machine-specific alert queries",
-                "table": "alerts",
-                "required_columns": ["machine_id", "timestamp"]
-            },
-            {
-                "name": "idx_alerts_status",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_alerts_status ON alerts(status)",
-                "description": "Optimizes alert status filtering",
-                "table": "alerts",
-                "required_columns": ["status"]
-            },
-            {
-                "name": "idx_alerts_severity",
-                "sql": "CREATE INDEX IF NOT EXISTS idx_alerts_severity ON alerts(severity)",
-                "description": "Optimizes alert severity filtering",
-                "table": "alerts",
-                "required_columns": ["severity"]
-            }
-        ]
-        
         results = {
             "created": [],
             "failed": [],
-            "total": len(indexes)
+            "total": len(PERFORMANCE_INDEXES)
         }
         
-        for index in indexes:
-            try:
-                # Check if table exists before creating index
-                table_name = index["table"]
-                check_table_sql = f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}'"
-                table_exists = self.db.execute(text(check_table_sql)).fetchone()
-                
-                if not table_exists:
-                    results["failed"].append({
-                        "name": index["name"],
-                        "error": f"Table {table_name} does not exist"
-                    })
-                    logger.warning(f"Skipped index {index['name']}: Table {table_name} does not exist")
-                    continue
-                
-                # Check if required columns exist
-                missing_columns = []
-                for column in index["required_columns"]:
-                    check_column_sql = f"PRAGMA table_info({table_name})"
-                    columns_info = self.db.execute(text(check_column_sql)).fetchall()
-                    column_names = [col[1] for col in columns_info]  # Column name is at index 1
-                    
-                    if column not in column_names:
-                        missing_columns.append(column)
-                
-                if missing_columns:
-                    results["failed"].append({
-                        "name": index["name"],
-                        "error": f"Missing columns: {', '.join(missing_columns)}"
-                    })
-                    logger.warning(f"Skipped index {index['name']}: Missing columns {missing_columns}")
-                    continue
-                
-                # Create the index
-                self.db.execute(text(index["sql"]))
-                self.db.commit()
-                results["created"].append({
-                    "name": index["name"],
-                    "description": index["description"]
+        # Look up the existing tables once, and each table's columns once, instead
+        # of querying the catalog for every index and column. The inspector works
+        # the same on SQLite and PostgreSQL.
+        inspector = inspect(self.db.connection())
+        existing_tables = set(inspector.get_table_names())
+        table_columns: Dict[str, set] = {}
+        
+        pending = []
+        for index in PERFORMANCE_INDEXES:
+            table_name = index.table
+            if table_name not in existing_tables:
+                results["failed"].append({
+                    "name": index.name,
+                    "error": f"Table {table_name} does not exist"
                 })
-                logger.info(f"Created index: {index['name']}")
-                
-            except Exception as e:
+                logger.warning(f"Skipped index {index.name}: Table {table_name} does not exist")
+                continue
+            
+            # Check if required columns exist
+            if table_name not in table_columns:
+                table_columns[table_name] = {
+                    column["name"] for column in inspector.get_columns(table_name)
+                }
+            missing_columns = [
+                column for column in index.required_columns
+                if column not in table_columns[table_name]
+            ]
+            
+            if missing_columns:
                 results["failed"].append({
-                    "name": index["name"],
-                    "error": str(e)
+                    "name": index.name,
+                    "error": f"Missing columns: {', '.join(missing_columns)}"
                 })
-                logger.error(f"Failed to create index {index['name']}: {e}")
+                logger.warning(f"Skipped index {index.name}: Missing columns {missing_columns}")
+                continue
+            
+            pending.append(index)
+        
+        # Create all applicable indexes in one transaction with a single commit
+        try:
+            for index in pending:
+                self.db.execute(text(index.sql))
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            # The whole batch is rolled back, and the failure may come from the
+            # commit rather than one statement, so every index in it failed
+            for index in pending:
+                results["failed"].append({
+                    "name": index.name,
+                    "error": f"Index batch rolled back: {e}"
+                })
+            logger.error(f"Failed to create {len(pending)} indexes, batch rolled back: {e}")
+            return results
+        
+        for index in pending:
+            results["created"].append({
+                "name": index.name,
+                "description": index.description
+            })
+            logger.info(f"Created index: {index.name}")
         
         return results
     
@@ -277,9 +301,9 @@ class DatabaseOptimizer:
     def _validate_columns_exist(self, table_name: str, columns: List[str]) -> bool:
         """Check if required columns exist in the table."""
         try:
-            # Get table info from SQLite
-            result = self.db.execute(text(f"PRAGMA table_info({table_name})"))
-            existing_columns = [row[1] for row in result.fetchall()]
+            existing_columns = {
+                column["name"] for column in inspect(self.db.connection()).get_columns(table_name)
+            }
             
             for column in columns:
                 if column not in existing_columns:
@@ -7,6 +7,7 @@ This module provides a REST API to interact with the trained predictive maintena
 and database for storing telemetry data and predictions.
 """
 
+import asyncio
 import os
 import sys
 from datetime import datetime, timedelta
@@ -21,7 +22,6 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import jwt
 from jwt.exceptions import InvalidTokenError as JWTError
-from passlib.context import CryptContext
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
@@ -30,11 +30,11 @@ from .db import engine, Base
 from .db_config import create_tables, get_db
 from .utils.time import get_current_timestamp
 from loguru import logger
-from .auth.models import User
+from .auth.models import User, pwd_context
 
 # Import auth router and service
 from .auth.routers import router as auth_router
-from .auth.service import AuthService
+from .auth.service import AuthService, run_activity_flusher
 from .auth.seed import seed_database
 
 # Import all our new improvements
@@ -58,6 +58,7 @@ from .core.security import (
 )
 from .core.session_security import SecureSessionMiddleware
 from .core.error_handling import register_error_handlers
+from .core.security_logging import security_logger
 
 # Import models - we'll need to create these
 try:
@@ -102,10 +103,22 @@ async def lifespan(app: FastAPI):
         print(f"⚠️ Warning: Could not initialize all systems: {e}")
         print("System will continue with basic functionality.")
     
+    # Batch last_login / last_used writes off the request path
+    activity_flusher = asyncio.create_task(run_activity_flusher())
+    
     yield
     
     # Shutdown
     logger.info("🛑 Shutting down Mining AI Platform API...")
+    activity_flusher.cancel()
+    try:
+        await activity_flusher
+    except asyncio.CancelledError:
+        pass
+    
+    # Drain log records still queued for enqueue=True handlers
+    await logger.complete()
+    security_logger.close()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -209,13 +222,12 @@ if os.getenv("ENVIRONMENT") == "production":
         raise ValueError("CRITICAL: Default secret key detected in production environment!")
     if JWT_SECRET_KEY == SECRET_KEY and not os.getenv("JWT_SECRET_KEY"):
         print("WARNING: JWT_SECRET_KEY not set, using same key as SECRET_KEY")
+    if not os.getenv("API_KEY_PEPPER"):
+        raise ValueError("CRITICAL: API_KEY_PEPPER must be set in production to hash API keys!")
 
 # Alert configuration
 ALERT_THRESHOLD = float(os.getenv("ALERT_THRESHOLD", "30.0"))  # Default health score threshold
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -328,7 +340,7 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 
 def get_password_hash(password: str) -> str:
-    """Hash a password using bcrypt."""
+    """Hash a password with the shared password policy."""
     return pwd_context.hash(password)
 
 
@@ -783,8 +795,10 @@ async def login_for_access_token(
     """OAuth2 compatible token endpoint for login."""
     auth_service = AuthService(db)
     
-    # Authenticate user
-    user = auth_service.authenticate_user(form_data.username, form_data.password)  # form_data.username is actually email in OAuth2PasswordRequestForm
+    # Authenticate user off the event loop; password hashing is deliberately slow
+    user = await asyncio.to_thread(
+        auth_service.authenticate_user, form_data.username, form_data.password  # form_data.username is actually email in OAuth2PasswordRequestForm
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -805,10 +819,6 @@ async def login_for_access_token(
         data={"sub": user.email}, expires_delta=access_token_expires  # Use email as subject
     )
     
-    # Update last login
-    user.last_login = datetime.utcnow()
-    db.commit()
-    
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Add user info endpoint
@@ -867,10 +877,18 @@ async def seed_database_endpoint(db: Session = Depends(get_db)):
 # Admin-only endpoints
 @app.get("/admin/users")
 async def get_all_users(
+    after_id: Optional[int] = Query(None, description="Return users with an ID greater than this"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; 100 when only after_id is given"),
     db: Session = Depends(get_db),
     current_user = Depends(require_admin)
 ):
-    """Get all users - Admin only."""
+    """Get all users - Admin only.
+    
+    Without after_id or limit every user is returned along with their total.
+    With either, one page ordered by ID is returned instead: count is the number
+    of users in the page, and next_after_id is passed as after_id to get the
+    next page (null on the last page).
+    """
     if User is None:
         raise HTTPException(
             status_code=status.HTTP_501_NOT_IMPLEMENTED,
@@ -878,8 +896,13 @@ async def get_all_users(
         )
     
     try:
-        users = db.query(User).all()
-        return {
+        paginated = after_id is not None or limit is not None
+        if paginated:
+            users, next_after_id = AuthService(db).get_all_users(after_id, limit or 100)
+        else:
+            users, next_after_id = AuthService(db).get_all_users()
+        
+        response = {
             "users": [
                 {
                     "id": user.id,
@@ -892,9 +915,14 @@ async def get_all_users(
                     "last_login": user.last_login.isoformat() if user.last_login else None
                 }
                 for user in users
-            ],
-            "total": len(users)
+            ]
         }
+        if paginated:
+            response["count"] = len(users)
+            response["next_after_id"] = next_after_id
+        else:
+            response["total"] = len(users)
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve users: {str(e)}")
 
@@ -0,0 +1,99 @@
+"""
+Tests for role assignment and session lookup in AuthService.
+"""
+import importlib
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# The application is a package named after its checkout directory
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT.parent))
+models = importlib.import_module(f"{ROOT.name}.auth.models")
+service = importlib.import_module(f"{ROOT.name}.auth.service")
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        models.User(id=1, email="a@example.com", username="a", full_name="A", hashed_password="x"),
+        models.Role(id=1, name="operator")
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_assigning_a_role_twice_is_rejected(db):
+    auth_service = service.AuthService(db)
+    auth_service.assign_role_to_user(1, 1, assigned_by=1)
+    
+    with pytest.raises(HTTPException) as exc_info:
+        auth_service.assign_role_to_user(1, 1, assigned_by=1)
+    assert exc_info.value.status_code == 400
+
+
+def test_concurrent_duplicate_is_reported_from_the_unique_constraint(db, monkeypatch):
+    auth_service = service.AuthService(db)
+    auth_service.assign_role_to_user(1, 1, assigned_by=1)
+    
+    # Let the duplicate past the upfront check, as a concurrent request would,
+    # so it is only caught by the constraint; SQLite gives no constraint name
+    checks = iter([False, True])
+    monkeypatch.setattr(auth_service, "_user_has_role", lambda user_id, role_id: next(checks))
+    
+    with pytest.raises(HTTPException) as exc_info:
+        auth_service.assign_role_to_user(1, 1, assigned_by=1)
+    assert exc_info.value.status_code == 400
+
+
+def test_other_integrity_errors_are_not_reported_as_duplicates(db):
+    auth_service = service.AuthService(db)
+    
+    with pytest.raises(IntegrityError):
+        auth_service.assign_role_to_user(1, None, assigned_by=1)
+
+
+def test_session_activity_is_only_queued_once_stale(db):
+    now = datetime.now(timezone.utc)
+    db.add_all([
+        models.UserSession(id=1, user_id=1, session_token="fresh", expires_at=now + timedelta(hours=1),
+                           last_activity=now - timedelta(seconds=5)),
+        models.UserSession(id=2, user_id=1, session_token="stale", expires_at=now + timedelta(hours=1),
+                           last_activity=now - timedelta(minutes=5))
+    ])
+    db.commit()
+    pending = service._pending_activity[models.UserSession]
+    pending.clear()
+    
+    auth_service = service.AuthService(db)
+    assert auth_service.get_session("fresh", now) is not None
+    assert auth_service.get_session("stale", now) is not None
+    assert list(pending) == [2]
+    pending.clear()
+
+
+def test_bulk_deactivation_is_visible_on_loaded_objects(db):
+    db.add(models.UserSession(id=1, user_id=1, session_token="token",
+                              expires_at=datetime.now(timezone.utc) + timedelta(hours=1)))
+    db.commit()
+    user = db.get(models.User, 1)
+    session = db.get(models.UserSession, 1)
+    
+    auth_service = service.AuthService(db)
+    assert auth_service.terminate_session(1)
+    assert auth_service.delete_user(1)
+    
+    # The updates skip session synchronization; their commits expire both objects
+    assert session.is_active is False
+    assert user.is_active is False
@@ -0,0 +1,29 @@
+"""
+Checks that the Alembic revision history resolves into a single chain.
+"""
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("alembic")
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _script_directory() -> ScriptDirectory:
+    config = Config(str(ROOT / "alembic.ini"))
+    config.set_main_option("script_location", str(ROOT / "alembic"))
+    return ScriptDirectory.from_config(config)
+
+
+def test_revisions_form_a_single_chain():
+    script = _script_directory()
+    
+    # walk_revisions raises if any down_revision cannot be resolved
+    revisions = list(script.walk_revisions())
+    
+    assert script.get_heads() == ["007_user_sessions_active_token_index"]
+    assert revisions[-1].revision == "001_add_missing_columns"
+    assert revisions[-1].down_revision is None